@@ -0,0 +1,193 @@
+"""Benchmarks of the api against the local MockServer, results are printed as one JSON document.
+
+        python -m benchmarks.run                      # all benchmarks
+        python -m benchmarks.run --only throughput    # some of them
+        python -m benchmarks.run --output results.json
+
+Needs aiohttp for the mock server. These are benchmarks, not tests: they
+measure and report, they do not assert.
+"""
+
+import argparse
+import gc
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from iqoption_api import IQOption
+from iqoption_api import fastjson
+from iqoption_api.metrics import Histogram
+from iqoption_api.mockserver import MockServer
+
+
+def quote_frames(symbols, count, start=1500000000.0, rate=1.0):
+    """`count` newChartData frames cycling through `symbols`, `rate` quotes per second and symbol"""
+
+    frames = []
+    for k in range(count):
+        active_id = k % symbols + 1
+        price = 1.1 + (k % 1000) * 1e-5
+        frames.append(fastjson.dumps({"name": "newChartData", "msg": {
+            "active_id": active_id, "symbol": "SYM{:03d}".format(active_id), "bid": price, "ask": price + 2e-4,
+            "value": price + 1e-4, "volume": 0, "time": start + (k // symbols) / rate,
+        }}))
+    return frames
+
+
+def offline_api(**options):
+    api = IQOption("benchmark@example.com", "password", **options)
+    api.send_raw = lambda payload: None
+    return api
+
+
+def summary(histogram):
+    snapshot = histogram.snapshot()
+    return dict((k, v) for k, v in snapshot.items() if k != "sum")
+
+
+def bench_login(args):
+    """Seconds from login() until instruments, leverages, top assets and positions arrived"""
+
+    histogram = Histogram()
+    with MockServer(symbols=args.symbols) as server:
+        for _ in range(args.logins):
+            api = IQOption("benchmark@example.com", "password", host=server.address, secure=False)
+            started = time.perf_counter()
+            api.login()
+            histogram.record(time.perf_counter() - started)
+            api.stop_socket_connection()
+    return {"logins": args.logins, "seconds": summary(histogram)}
+
+
+def bench_throughput(args):
+    """Processed frames/sec through on_socket_message, inline and with a worker thread.
+
+    `frames_per_second` counts processed frames only, with `drop_stale_quotes`
+    most quotes are dropped, `workers_block` processes every frame.
+    """
+
+    frames = quote_frames(args.symbols, args.frames)
+    results = {"frames": len(frames), "json_backend": fastjson.backend}
+    cases = (
+        ("inline", {}),
+        ("workers", {"workers": 1, "overflow": "drop_stale_quotes"}),
+        ("workers_block", {"workers": 1, "overflow": "block"}),
+    )
+    for name, options in cases:
+        api = offline_api(**options)
+        on_socket_message = api.on_socket_message
+        started = time.perf_counter()
+        for frame in frames:
+            on_socket_message(None, frame)
+        if api.events is not None:
+            # wait until the workers processed everything queued
+            api.events.stop()
+        seconds = time.perf_counter() - started
+        processed = api.events.processed if api.events is not None else len(frames)
+        results[name] = {"processed": processed, "frames_per_second": processed / seconds}
+        if api.events is not None:
+            results[name]["dropped"] = api.events.dropped
+    return results
+
+
+def bench_memory(args):
+    """Traced memory after every simulated hour of quotes and position churn"""
+
+    api = offline_api(keep_closed=100)
+    per_hour = args.symbols * args.quote_rate * 3600
+    gc.collect()
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    hours = []
+    position_id = 0
+    for hour in range(args.hours):
+        start = 1500000000.0 + hour * 3600
+        for k, frame in enumerate(quote_frames(args.symbols, per_hour, start, args.quote_rate)):
+            api.on_socket_message(None, frame)
+            if k % 1000 == 0:
+                # open a position and close the one opened before
+                position_id += 1
+                for id, status in ((position_id, "open"), (position_id - 1, "closed"))[:position_id]:
+                    api.parse_position_message({
+                        "id": id, "status": status, "instrument_type": "forex", "instrument_id": "SYM001",
+                        "leverage": 50, "buy_avg_price_enrolled": 1.1, "sell_avg_price_enrolled": 0.0,
+                        "create_at": start * 1000, "close_at": start * 1000, "close_reason": "default", "orders": [],
+                    })
+        gc.collect()
+        hours.append({
+            "hour": hour + 1,
+            "bytes": tracemalloc.get_traced_memory()[0] - baseline,
+            "open_positions": len(api.positions.open_ids()),
+            "closed_positions": len(api.positions.closed_ids()),
+        })
+    tracemalloc.stop()
+    return {"symbols": args.symbols, "quote_rate": args.quote_rate, "hours": hours}
+
+
+def bench_orders(args):
+    """Seconds from place-order-temp until its reply and until the position arrived"""
+
+    reply = Histogram()
+    position = Histogram()
+    with MockServer(symbols=args.symbols) as server:
+        api = IQOption("benchmark@example.com", "password", host=server.address, secure=False)
+        api.login()
+        for _ in range(args.orders):
+            known = len(api.positions.open_ids())
+            started = time.perf_counter()
+            future = api.buy_forex(1, "EURUSD", 50, "buy")
+            future.result(args.order_timeout)
+            reply.record(time.perf_counter() - started)
+            deadline = started + args.order_timeout
+            while len(api.positions.open_ids()) == known:
+                if time.perf_counter() > deadline:
+                    raise RuntimeError("position of order {} did not arrive within {}s".format(future.result()["id"], args.order_timeout))
+                time.sleep(0)
+            position.record(time.perf_counter() - started)
+        api.stop_socket_connection()
+    return {"orders": args.orders, "reply_seconds": summary(reply), "position_seconds": summary(position)}
+
+
+BENCHMARKS = {
+    "login": bench_login,
+    "throughput": bench_throughput,
+    "memory": bench_memory,
+    "orders": bench_orders,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--only", action="append", choices=sorted(BENCHMARKS), help="run only these benchmarks")
+    parser.add_argument("--output", help="write the JSON results to this file instead of stdout")
+    parser.add_argument("--symbols", type=int, default=20)
+    parser.add_argument("--logins", type=int, default=20)
+    parser.add_argument("--frames", type=int, default=200000)
+    parser.add_argument("--hours", type=int, default=4, help="simulated hours of the memory benchmark")
+    parser.add_argument("--quote-rate", type=int, default=1, help="quotes per second and symbol of the memory benchmark")
+    parser.add_argument("--orders", type=int, default=200)
+    parser.add_argument("--order-timeout", type=float, default=10, help="seconds to wait for an order reply or position")
+    args = parser.parse_args(argv)
+
+    results = {
+        "started_at": time.time(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "json_backend": fastjson.backend,
+        "benchmarks": {},
+    }
+    for name in args.only or sorted(BENCHMARKS):
+        started = time.perf_counter()
+        results["benchmarks"][name] = BENCHMARKS[name](args)
+        results["benchmarks"][name]["wall_seconds"] = time.perf_counter() - started
+    output = json.dumps(results, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -1 +1,6 @@
-from .api import IQOption
\ No newline at end of file
+from .api import IQOption
+from .manager import AccountManager
+try:
+    from .aio import AsyncIQOption
+except (ImportError, SyntaxError):  # needs aiohttp and python 3.6
+    pass
@@ -0,0 +1,259 @@
+import asyncio
+import logging
+import time
+import aiohttp
+from .api import IQOption
+
+
+class AsyncIQOption(IQOption):
+    """asyncio version of IQOption, one event loop can drive many instances.
+
+    All message parsing is shared with IQOption, only the transport differs:
+    the socket is read by a task of the running loop and outgoing frames are
+    queued and written by a second task, so handlers never block the loop.
+
+        async with AsyncIQOption("mail@email.com", "password") as api:
+            await api.login()
+            api.subscribe_market("EURUSD")
+            async for symbol, quote in api.quotes():
+                ...
+    """
+
+    def __init__(self, username, password, host="iqoption.com", stream_size=1000, **kwargs):
+        if kwargs.get("workers"):
+            # handlers feed asyncio queues and the writer queue, they have to run on the loop
+            raise ValueError("AsyncIQOption handles messages on the event loop, workers are not supported")
+        IQOption.__init__(self, username, password, host, **kwargs)
+        self.logger = logging.getLogger("iqoption_api.aio")
+        self.stream_size = stream_size
+        self._outgoing = None
+        self._reader = None
+        self._writer = None
+        self._closing = False
+        self._tasks = []
+        self._conflation_task = None
+        self._tpsl_task = None
+        self._quote_streams = []
+        self._position_streams = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def create_session(self):
+        """The aiohttp session has to be created inside the running loop, see login"""
+        self.session = None
+
+    def create_socket(self):
+        """The socket is opened by connect"""
+        self.socket = None
+
+    async def login(self):
+        """Login, connect the socket and request instruments, top assets and positions"""
+
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+        data = {"email": self.username, "password": self.password}
+        async with self.session.post(self.login_url, data=data) as response:
+            json_login_response = await response.json(content_type=None)
+            if json_login_response["isSuccessful"]:
+                self._ssid = response.cookies["ssid"].value
+        if json_login_response["isSuccessful"]:
+            self.parse_account_info(json_login_response)
+            await self.connect()
+            await self.load_metadata()
+            await self.wait_for(self.get_positions())
+        return json_login_response["isSuccessful"]
+
+    async def load_metadata(self):
+        """Request instruments, leverages and top assets unless the instrument cache already has them.
+
+        Metadata loaded from the metadata_file is used right away and refreshed by a background task.
+        """
+
+        if not self.has_metadata():
+            await self.refresh_metadata()
+        elif self.instrument_cache.needs_refresh:
+            self.instrument_cache.needs_refresh = False
+            self._tasks.append(asyncio.get_event_loop().create_task(self.refresh_metadata()))
+
+    async def refresh_metadata(self):
+        """Request instruments, leverages and top assets and save them to the metadata_file"""
+
+        requests = self.get_top_assets()
+        complete = await self.wait_for(self.get_instruments())
+        # parse_instruments_message requested the leverages of every category
+        complete = await self.wait_for(requests + list(self._leverage_requests.values())) and complete
+        self.save_metadata(complete)
+        return complete
+
+    async def wait_for(self, futures, timeout=None):
+        """Wait for request futures, returns True if all got a successful reply"""
+
+        if futures:
+            await asyncio.wait([asyncio.wrap_future(future) for future in futures], timeout=self.pending.timeout if timeout is None else timeout)
+        return IQOption.wait_for(self, futures, 0)
+
+    async def connect(self):
+        """Open the websocket and start the reader and writer tasks"""
+
+        self._closing = False
+        self.socket = await self.session.ws_connect(self.socket_url, heartbeat=self.ping_interval)
+        loop = asyncio.get_event_loop()
+        if self._outgoing is None:
+            self._outgoing = asyncio.Queue()
+        if self._writer is None:
+            self._writer = loop.create_task(self._write_socket())
+        self._reader = loop.create_task(self._read_socket())
+        self.on_socket_connect(self.socket)
+
+    async def close(self):
+        """Stop the socket tasks, close socket and session and stop the components, see IQOption.stop_components"""
+
+        self._closing = True
+        for task in self._tasks + [self._reader, self._writer]:
+            if task is not None:
+                task.cancel()
+        self._tasks = []
+        self._reader = None
+        self._writer = None
+        self._conflation_task = None
+        self._tpsl_task = None
+        if self.socket is not None:
+            await self.socket.close()
+        if self.session is not None:
+            await self.session.close()
+        self.stop_components()
+
+    def start_socket_connection(self):
+        raise RuntimeError("use `await connect()` with AsyncIQOption")
+
+    def stop_socket_connection(self):
+        raise RuntimeError("use `await close()` with AsyncIQOption")
+
+    def send_raw(self, payload):
+        """Queue a frame, it is written by the writer task"""
+        self._outgoing.put_nowait(payload)
+
+    def on_socket_close(self, socket, *args):
+        IQOption.on_socket_close(self, socket, *args)
+        # frames queued for the lost connection are not replayed, on_socket_connect restores the session
+        while not self._outgoing.empty():
+            self._outgoing.get_nowait()
+
+    async def _write_socket(self):
+        while True:
+            payload = await self._outgoing.get()
+            try:
+                await self.socket.send_str(payload)
+            except (ConnectionError, RuntimeError, aiohttp.ClientError):
+                self.logger.warning("socket closed, dropping frame")
+
+    async def _read_socket(self):
+        try:
+            async for frame in self.socket:
+                if frame.type == aiohttp.WSMsgType.TEXT:
+                    try:
+                        self.on_socket_message(self.socket, frame.data)
+                    except Exception:
+                        self.logger.exception("error handling socket message")
+                elif frame.type == aiohttp.WSMsgType.ERROR:
+                    self.on_socket_error(self.socket, self.socket.exception())
+                    break
+        finally:
+            self.on_socket_close(self.socket)
+        if self.reconnect and not self._closing:
+            await self._reconnect()
+
+    async def _reconnect(self):
+        """Reconnect with exponential backoff, on_socket_connect then resumes the session"""
+
+        delay = self.reconnect_delay
+        while not self._closing:
+            self.logger.warning("socket connection lost, reconnecting in {:.1f}s".format(delay))
+            await asyncio.sleep(delay)
+            self._reconnect_started = time.time()
+            try:
+                await self.connect()
+                return
+            except (aiohttp.ClientError, OSError, asyncio.TimeoutError) as error:
+                self.logger.warning("reconnect failed: {}".format(error))
+                delay = min(delay * 2, self.max_reconnect_delay)
+
+    async def change_account(self, account_type):
+        """Change active account `real` or `practice`"""
+
+        data = {"balance_id": self.account_to_id[account_type.lower()]}
+        async with self.session.post(self.change_account_url, data=data):
+            pass
+        await self.update_info()
+        return self.active_account
+
+    async def update_info(self):
+        """Update Account Info"""
+
+        async with self.session.get(self.getprofile_url) as response:
+            self.parse_account_info(await response.json(content_type=None))
+
+    async def resubscribe_market(self, market_name=None, market_id=None):
+        conflate = (self.instruments_to_id.get(market_name) if market_name else market_id) in self.conflated_markets
+        self.unsubscribe_market(market_name, market_id)
+        await asyncio.sleep(0.2)
+        self.subscribe_market(market_name, market_id, conflate)
+
+    def store_quote(self, symbol, message):
+        IQOption.store_quote(self, symbol, message)
+        self._publish(self._quote_streams, (symbol, message))
+
+    def start_conflation(self):
+        """Conflated quotes are flushed by a task of the loop instead of a thread"""
+        if self._conflation_task is None:
+            self._conflation_task = asyncio.get_event_loop().create_task(self._flush_conflated())
+            self._tasks.append(self._conflation_task)
+
+    async def _flush_conflated(self):
+        while True:
+            await asyncio.sleep(self.conflator.interval)
+            self.conflator.flush()
+
+    def start_tpsl(self):
+        """Deferred tp/sl updates are flushed by a task of the loop instead of a thread"""
+        if self._tpsl_task is None:
+            self._tpsl_task = asyncio.get_event_loop().create_task(self._flush_tpsl())
+            self._tasks.append(self._tpsl_task)
+
+    async def _flush_tpsl(self):
+        while True:
+            await asyncio.sleep(self.tpsl.tick)
+            self.tpsl.flush()
+
+    def parse_position_message(self, message):
+        position = IQOption.parse_position_message(self, message)
+        self._publish(self._position_streams, position)
+        return position
+
+    def _publish(self, streams, item):
+        for queue in streams:
+            if queue.full():
+                # slow consumer, drop the oldest item rather than stalling the socket
+                queue.get_nowait()
+            queue.put_nowait(item)
+
+    async def _stream(self, streams):
+        queue = asyncio.Queue(self.stream_size)
+        streams.append(queue)
+        try:
+            while True:
+                yield await queue.get()
+        finally:
+            streams.remove(queue)
+
+    def quotes(self):
+        """`async for symbol, quote in api.quotes()` over every received quote"""
+        return self._stream(self._quote_streams)
+
+    def positions_stream(self):
+        """`async for position in api.positions_stream()` over every position update"""
+        return self._stream(self._position_streams)
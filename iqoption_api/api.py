@@ -1,10 +1,27 @@
 import requests
 import websocket
 import time
-from threading import Thread
+import os
+from threading import Thread, Event, Lock
+from concurrent.futures import wait
 from datetime import datetime
 import json
-from .position import Position
+from .book import PositionBook
+from .archive import PositionArchive
+from .watermarks import WatermarkStore
+from .tpsl import TPSLScheduler
+from .instruments import InstrumentCache
+from .market_data import MarketData
+from .pending import PendingRequests, RequestError
+from .events import EventQueue
+from .conflation import QuoteConflator
+from .candles import CandleAggregator
+from .portfolio import evaluate_positions
+from .replay import FrameRecorder
+from .metrics import Metrics
+from .tracing import SampledTracer
+from .orders import OrderTracker, OrderError, check_order, failed_future
+from . import fastjson
 import logging
 
 
@@ -13,33 +30,130 @@ class IQOption():
     practice_balance = 0
     real_balance = 0
     server_time = 0
-    positions = {}
     instruments_categories = ["cfd", "forex", "crypto", "digital-option"]
     top_assets_categories = ["forex", "crypto", "binary"]
-    instruments_to_id = {}
-    id_to_instruments = {}
-    market_data = {}
-    last_market_data = {}
-    stoploss_update = {}
-    loaded_watermarks = {}
-    spread = {}
-
-    def __init__(self, username, password, host="iqoption.com"):
+    # dropped by on_socket_message before decoding
+    ignored_messages = frozenset(["tradersPulse", "tournament", "activeCommissionChange", "front"])
+
+    def __init__(self, username, password, host="iqoption.com", tick_capacity=20000, tick_window=None, request_timeout=10,
+                 workers=0, queue_size=10000, overflow=EventQueue.DROP_STALE_QUOTES,
+                 conflation_interval=0.25, candle_intervals=None, candle_capacity=1000,
+                 archive=None, keep_closed=None, watermark_file=None, watermark_flush_interval=1.0,
+                 reconnect=True, reconnect_delay=0.1, max_reconnect_delay=30, ping_interval=20,
+                 instrument_cache=None, metadata_file=None, metadata_ttl=7*24*3600, record_file=None,
+                 metrics=False, trace_every=None, trace_handler=None, secure=True,
+                 order_timeout=30, tpsl_rate=10, tpsl_burst=10, tpsl_position_interval=0.5, tpsl_confirm_timeout=5,
+                 tpsl_max_retries=3):
 
         self.username = username
         self.password = password
         self.host = host
-        self.session = requests.Session()
+        # secure=False connects with http/ws, e.g. to a local MockServer
+        self.secure = secure
         self.client_platform_id = 9
         self.generate_urls()
-        self.socket = websocket.WebSocketApp(self.socket_url, on_open=self.on_socket_connect, on_message=self.on_socket_message, on_close=self.on_socket_close, on_error=self.on_socket_error)
+        self.create_session()
+        self.create_socket()
         self.logger = logging.getLogger("iqoption_api")
+        self.market_data = MarketData(tick_capacity, tick_window)
+        # quotes are stored from the socket (or worker) thread and the conflation thread
+        self._quote_lock = Lock()
+        self.last_market_data = {}
+        self.spread = {}
+        # instrument metadata may be shared with other accounts, see AccountManager
+        self.instrument_cache = instrument_cache if instrument_cache is not None else InstrumentCache()
+        self.instruments_to_id = self.instrument_cache.instruments_to_id
+        self.id_to_instruments = self.instrument_cache.id_to_instruments
+        # instruments, leverages and top assets are read from and saved to metadata_file
+        self.metadata_file = metadata_file
+        if metadata_file is not None and not self.instrument_cache.needs_refresh:
+            self.instrument_cache.load(metadata_file, metadata_ttl)
+        if isinstance(archive, str):
+            archive = PositionArchive(archive)
+        if archive is not None and keep_closed is None:
+            keep_closed = 100
+        self.positions = PositionBook(archive, keep_closed)
+        self.positions.on_evict.append(self.forget_position)
+        # change-tpsl budget: tpsl_rate per second overall (bursts of tpsl_burst), one per tpsl_position_interval per position
+        self.tpsl = TPSLScheduler(self.send_tpsl, tpsl_rate, tpsl_burst, tpsl_position_interval, tpsl_confirm_timeout, tpsl_max_retries)
+        # futures of submit_orders, resolved by order-changed/position-changed
+        self.orders = OrderTracker(order_timeout)
+        self.loaded_watermarks = {}
+        # watermarks are persisted automatically when a watermark_file is given
+        self.watermarks = None
+        if watermark_file is not None:
+            self.watermarks = WatermarkStore(watermark_file, watermark_flush_interval)
+            self.loaded_watermarks = self.watermarks.load()
+            self.watermarks.start()
+        self.pending = PendingRequests(request_timeout)
+        # every received frame is written to record_file, see replay.Replayer
+        self.recorder = FrameRecorder(record_file) if record_file is not None else None
+        # counters and latency histograms, None (and free) unless enabled
+        self.metrics = Metrics() if metrics else None
+        # structured trace of 1 in trace_every quotes per symbol, written by a background thread
+        self.tracer = None
+        if trace_every:
+            self.tracer = SampledTracer(trace_every, trace_handler)
+            self.tracer.start()
+        self.connected = Event()
+        # reconnect with exponential backoff, re-applying the subscriptions
+        self.reconnect = reconnect
+        self.reconnect_delay = reconnect_delay
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ping_interval = ping_interval
+        self.subscriptions = set()
+        self.disconnected_at = None
+        self.connection_stats = {"reconnects": 0, "last_gap": None, "max_gap": 0.0, "total_gap": 0.0, "last_reconnect_latency": None}
+        self._next_reconnect_delay = reconnect_delay
+        self._reconnect_started = None
+        self._stopping = Event()
+        self._leverage_requests = {}
+        self.ignored_messages = set(self.ignored_messages)
+        self.handlers = {
+            "newChartData": self.parse_new_chart_data_message,
+            "heartbeat": self.answer_heartbeat,
+            "timeSync": self.parse_time_sync,
+            "position-changed": self.parse_position_message,
+            "order-changed": self.parse_order_changed,
+            "tpsl-changed": self.parse_tpsl_changed,
+            "order-placed-temp": self.parse_order_placed,
+            "profile": self.parse_profile_message,
+            "positions": self.parse_positions_message,
+            "top-assets": self.parse_top_assets_message,
+            "instruments": self.parse_instruments_message,
+            "available-leverages": self.parse_available_leverages,
+            "result": self.parse_result_message,
+        }
+        # with workers the socket thread only answers heartbeats and queues everything else
+        self.events = EventQueue(self.process_message, queue_size, workers, overflow) if workers > 0 else None
+        # active ids of the markets subscribed with conflate=True
+        self.conflated_markets = set()
+        self.conflator = QuoteConflator(self.store_quote, conflation_interval)
+        self.candles = CandleAggregator(candle_intervals, candle_capacity) if candle_intervals else None
+
+    def __getattr__(self, name):
+        # forex_instruments, forex_leverages, forex_top_assets, ... are served by the instrument cache
+        cache = self.__dict__.get("instrument_cache")
+        if cache is None:
+            raise AttributeError(name)
+        try:
+            return cache.lookup(name)
+        except KeyError:
+            raise AttributeError(name)
+
+    def create_session(self):
+        """Create the HTTP session"""
+        self.session = requests.Session()
+
+    def create_socket(self):
+        """Create the websocket (connected by start_socket_connection)"""
+        self.socket = websocket.WebSocketApp(self.socket_url, on_open=self.on_socket_connect, on_message=self.on_socket_message, on_close=self.on_socket_close, on_error=self.on_socket_error)
 
     def generate_urls(self):
         """Generates Required Urls to operate the API"""
 
-        self.api_url = "https://{}/api/".format(self.host)
-        self.socket_url = "wss://{}/echo/websocket".format(self.host)
+        self.api_url = "{}://{}/api/".format("https" if self.secure else "http", self.host)
+        self.socket_url = "{}://{}/echo/websocket".format("wss" if self.secure else "ws", self.host)
         self.login_url = self.api_url+"login"
         self.profile_url = self.api_url+"profile"
         self.change_account_url = self.profile_url+"/"+"changebalance"
@@ -54,16 +168,67 @@ class IQOption():
 
         json_login_response = self.__login_response.json()
         if json_login_response["isSuccessful"]:
-            self.__ssid = self.__login_response.cookies["ssid"]
+            self._ssid = self.__login_response.cookies["ssid"]
             self.parse_account_info(json_login_response)
             self.start_socket_connection()
-            time.sleep(1)  # artificial delay to complete socket connection
-            self.get_instruments()
-            self.get_top_assets()
-            self.get_positions()
-            time.sleep(1)  # artificial delay to populate symbols
+            if not self.connected.wait(self.pending.timeout):
+                self.logger.error("socket connection timed out")
+                return False
+            self.load_metadata()
+            self.wait_for(self.get_positions())
         return json_login_response["isSuccessful"]
 
+    def has_metadata(self):
+        cache = self.instrument_cache
+        return cache.has_instruments(self.instruments_categories) and cache.has_top_assets(self.top_assets_categories)
+
+    def load_metadata(self):
+        """Request instruments, leverages and top assets unless the instrument cache already has them.
+
+        Metadata loaded from the metadata_file is used right away and refreshed on a background thread.
+        """
+
+        if not self.has_metadata():
+            self.refresh_metadata()
+        elif self.instrument_cache.needs_refresh:
+            self.instrument_cache.needs_refresh = False
+            refresh = Thread(target=self.refresh_metadata, name="iqoption-metadata")
+            refresh.daemon = True
+            refresh.start()
+
+    def refresh_metadata(self):
+        """Request instruments, leverages and top assets and save them to the metadata_file"""
+
+        requests = self.get_top_assets()
+        complete = self.wait_for(self.get_instruments())
+        # parse_instruments_message requested the leverages of every category
+        complete = self.wait_for(requests + list(self._leverage_requests.values())) and complete
+        self.save_metadata(complete)
+        return complete
+
+    def save_metadata(self, complete):
+        if self.metadata_file is None:
+            return
+        if not complete:
+            # keep the previous file rather than saving partial metadata
+            self.instrument_cache.needs_refresh = True
+            return
+        try:
+            self.instrument_cache.save(self.metadata_file)
+        except (IOError, OSError):
+            self.logger.exception("error saving instrument metadata to {}".format(self.metadata_file))
+
+    def wait_for(self, futures, timeout=None):
+        """Wait for request futures, returns True if all got a successful reply"""
+
+        done, not_done = wait(futures, self.pending.timeout if timeout is None else timeout)
+        for future in not_done:
+            self.logger.warning("no reply to {} ({}) yet".format(future.name, future.request_id))
+        failed = [future for future in done if future.exception() is not None]
+        for future in failed:
+            self.logger.warning("request {} ({}) failed: {}".format(future.name, future.request_id, future.exception()))
+        return not not_done and not failed
+
     def parse_account_info(self, jsondata):
         """Parse Account Info"""
 
@@ -78,90 +243,202 @@ class IQOption():
         self.logger.info("active account: {0}".format(self.active_account))
         self.logger.info("active account id: {0}".format(self.active_account_id))
 
+    def register_handler(self, name, handler):
+        """Call `handler(msg)` for every message named `name`, replaces the current handler"""
+
+        self.ignored_messages.discard(name)
+        self.handlers[name] = handler
+
+    def unregister_handler(self, name, ignore=False):
+        """Remove the handler of `name`, `ignore=True` drops those messages without decoding"""
+
+        self.handlers.pop(name, None)
+        if ignore:
+            self.ignored_messages.add(name)
+
     def on_socket_message(self, socket, message):
-        message = json.loads(message)
+        if self.recorder is not None:
+            self.recorder.record(message)
+        name = fastjson.peek_name(message)
+        if self.metrics is not None:
+            self.metrics.count_received(name)
+        if name in self.ignored_messages:
+            return
+        if self.events is not None and name != "heartbeat":
+            self.events.put(message, name)
+            if self.metrics is not None:
+                self.metrics.backlog.record(self.events.depth())
+            return
+        self.process_message(message)
+
+    def process_message(self, message):
+        """Decode and handle a raw frame"""
+
+        if self.metrics is not None:
+            started = time.perf_counter()
+        message = fastjson.loads(message)
         messagename = message["name"]
         msg = message["msg"]
+        request_id = message.get("request_id")
         try:
             if message['status'] > 4000:
                 self.logger.error('Error on socket message: {}'.format(message))
+                if request_id is not None:
+                    self.pending.fail(request_id, RequestError(message))
                 return
-        except (AttributeError, KeyError):
+        except (AttributeError, KeyError, TypeError):
             pass
 
-        if messagename == "timeSync":
-            self.__server_timestamp = msg
-            self.server_time = datetime.fromtimestamp(self.__server_timestamp/1000)
-            self.tick = self.server_time.second
-
-        elif messagename in ["tradersPulse", "tournament", "activeCommissionChange", "order-placed-temp", "front"]:
-            pass
-
-        elif messagename == "heartbeat":
-            self.answer_heartbeat(msg)
-
-        elif messagename == "profile":
-            self.parse_profile_message(msg)
-
-        elif messagename == "position-changed":
-            self.parse_position_message(msg)
-
-        elif messagename == "newChartData":
-            self.parse_new_chart_data_message(msg)
-
-        elif messagename == "top-assets":
-            self.parse_top_assets_message(msg)
-
-        elif messagename == "instruments":
-            self.parse_instruments_message(msg)
-
-        elif messagename == "available-leverages":
-            self.parse_available_leverages(msg)
+        self.dispatch_message(messagename, msg)
+        if self.metrics is not None:
+            self.metrics.record_parse_time(messagename, time.perf_counter() - started)
+        # resolve after the handler ran so waiters see the parsed data
+        if request_id is not None and request_id in self.pending:
+            self.resolve_request(request_id, messagename, msg)
+        self.pending.expire()
+        self.orders.expire()
+
+    def resolve_request(self, request_id, messagename, msg):
+        if messagename == "result":
+            # plain acknowledgement, the actual reply follows unless it failed
+            if isinstance(msg, dict) and msg.get("success") is False:
+                self.pending.fail(request_id, RequestError(msg))
+            elif self.pending.get(request_id).ack:
+                self.pending.resolve(request_id, msg)
+            return
+        self.pending.resolve(request_id, msg)
 
-        elif messagename == "order-changed":
-            self.parse_order_changed(msg)
+    def dispatch_message(self, messagename, msg):
+        handler = self.handlers.get(messagename)
+        if handler is not None:
+            handler(msg)
+        else:
+            self.logger.info("unknown message: {0}".format(messagename))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug(msg)
 
-        elif messagename == "tpsl-changed":
-            self.parse_tpsl_changed(msg)
+    def parse_time_sync(self, message):
+        self.__server_timestamp = message
+        self.server_time = datetime.fromtimestamp(self.__server_timestamp/1000)
+        self.tick = self.server_time.second
 
-        elif messagename == "positions":
-            self.parse_positions_message(msg)
+    def parse_order_placed(self, message):
+        """{'id': 198025634}, reply to place-order-temp, handled through its request future"""
 
-        else:
-            self.logger.info("unknown message: {0}".format(messagename))
-            self.logger.debug(msg)
-            pass
+    def parse_result_message(self, message):
+        """{'success': True}, acknowledgement of a request, handled through its request future"""
 
     def on_socket_connect(self, socket):
         """Called on Socket Connection"""
 
         self.initial_subscriptions()
+        if self.disconnected_at is not None:
+            self.resume_session()
+        self._next_reconnect_delay = self.reconnect_delay
+        self.connected.set()
         self.logger.debug("on socket connect")
 
+    def resume_session(self):
+        """Re-apply the market subscriptions and re-sync the positions after a reconnect"""
+
+        now = time.time()
+        gap = now - self.disconnected_at
+        stats = self.connection_stats
+        stats["reconnects"] += 1
+        stats["last_gap"] = gap
+        stats["max_gap"] = max(stats["max_gap"], gap)
+        stats["total_gap"] += gap
+        if self._reconnect_started is not None:
+            stats["last_reconnect_latency"] = now - self._reconnect_started
+        self.disconnected_at = None
+        self._reconnect_started = None
+        self.logger.info("reconnected after {:.3f}s, resubscribing {} markets".format(gap, len(self.subscriptions)))
+        for market_id in self.subscriptions:
+            self.send_subscription("subscribeMessage", market_id)
+        if hasattr(self, "active_account_id"):
+            self.get_positions()
+
     def on_socket_error(self, socket, error):
         """Called on Socket Error"""
         self.logger.exception(error)
 
-    def on_socket_close(self, socket):
+    def on_socket_close(self, socket, *args):
         """Called on Socket Close"""
 
+        self.connected.clear()
+        if self.disconnected_at is None:
+            self.disconnected_at = time.time()
+        self.pending.cancel_all(RequestError("socket connection closed"))
+
     def start_socket_connection(self):
         """Start Socket Connection"""
-        self.socket_thread = Thread(target=self.socket.run_forever).start()
+        self._stopping.clear()
+        self.socket_thread = Thread(target=self.run_socket, name="iqoption-socket")
+        self.socket_thread.start()
+
+    def run_socket(self):
+        """Run the socket until stop_socket_connection, reconnecting with exponential backoff"""
+
+        while True:
+            self.socket.run_forever(ping_interval=self.ping_interval)
+            if self._stopping.is_set() or not self.reconnect:
+                break
+            delay = self._next_reconnect_delay
+            self._next_reconnect_delay = min(delay * 2, self.max_reconnect_delay)
+            self.logger.warning("socket connection lost, reconnecting in {:.1f}s".format(delay))
+            if self._stopping.wait(delay):
+                break
+            self._reconnect_started = time.time()
+            self.create_socket()
 
     def stop_socket_connection(self):
         self.logger.info("closing websocket connection")
+        self._stopping.set()
         self.socket.close()
         self.logger.info("websocket connection closed")
+        self.stop_components()
+
+    def stop_components(self):
+        """Stop the background threads, deliver conflated quotes and write pending watermarks and frames"""
+
+        if self.events is not None:
+            self.events.stop()
+        self.conflator.stop()
+        if self.watermarks is not None:
+            self.watermarks.close()
+        self.tpsl.stop()
+        if self.recorder is not None:
+            self.recorder.close()
+        if self.tracer is not None:
+            self.tracer.stop()
+
+    def event_stats(self):
+        """Queue depth and counters of the event queue, None without workers"""
+        return self.events.stats() if self.events is not None else None
+
+    def send_socket_message(self, name, msg, log=True, timeout=None, callback=None, ack=False):
+        """Send a frame, `sendMessage` frames get a request_id and return the future of their reply (with `ack` the server acknowledgement)"""
 
-    def send_socket_message(self, name, msg, log=True):
         data = {"name": name, "msg": msg}
-        if log:
+        future = None
+        if name == "sendMessage":
+            data["request_id"] = self.pending.new_id()
+            future = self.pending.register(data["request_id"], msg["name"], timeout, callback, ack)
+        if log and self.logger.isEnabledFor(logging.DEBUG):
             self.logger.debug("send_socket_message: {0}".format(data))
-        self.socket.send(json.dumps(data))
+        if self.metrics is not None:
+            self.metrics.count_sent(msg["name"] if future is not None else name)
+            if future is not None and msg["name"] == "place-order-temp":
+                self.metrics.order_sent(future)
+        self.send_raw(fastjson.dumps(data))
+        return future
+
+    def send_raw(self, payload):
+        """Send an already encoded frame"""
+        self.socket.send(payload)
 
     def initial_subscriptions(self):
-        self.send_socket_message("ssid", self.__ssid)
+        self.send_socket_message("ssid", self._ssid)
         self.send_socket_message("subscribe", "tradersPulse")
 
     def parse_profile_message(self, message):
@@ -174,12 +451,16 @@ class IQOption():
             self.active_account = self.id_to_account[message["balance_id"]]
 
     def answer_heartbeat(self, heartbeattime):
+        if self.metrics is not None:
+            self.metrics.heartbeat_lag.record(time.time() - heartbeattime / 1000.0)
         self.send_socket_message("heartbeat", {"userTime": "{:.0f}".format(time.time()*100), "heartbeatTime": heartbeattime}, False)
 
     def store_watermarks(self, filename):
-        with open(filename, 'w') as f:
+        # write a temporary file and swap it in, a crash never leaves a partial file behind
+        with open(filename + ".tmp", 'w') as f:
             for pos in self.get_open_positions():
                 f.write("{},{},{}\n".format(pos.id, pos.min_watermark, pos.max_watermark))
+        os.replace(filename + ".tmp", filename)
 
     def load_watermarks(self, filename):
         with open(filename, 'r') as f:
@@ -191,27 +472,54 @@ class IQOption():
 
     def parse_position_message(self, message):
         id = message["id"]
-        self.logger.debug("parsed position: {0}".format(id))
-        self.logger.debug("parsed position: {}".format(message))
-        if id in self.positions:
-            self.positions[id].update(message)
-        else:
-            self.positions[id] = Position(message)
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("parsed position: {}".format(message))
+        position, created = self.positions.update(message)
+        self.orders.on_position_changed(position)
+        if self.tracer is not None:
+            self.tracer.event("position", id=id, status=position.status, instrument_id=position.instrument_id, created=created)
+        if created:
             if id in self.loaded_watermarks:
-                self.positions[id].min_watermark = self.loaded_watermarks[id]['min']
-                self.positions[id].max_watermark = self.loaded_watermarks[id]['max']
+                position.min_watermark = self.loaded_watermarks[id]['min']
+                position.max_watermark = self.loaded_watermarks[id]['max']
+                position.current_watermark = self.loaded_watermarks[id].get('current', position.current_watermark)
+        if self.watermarks is not None:
+            if position.is_open():
+                position.set_watermark_listener(self.watermarks.record)
+            else:
+                self.watermarks.forget(id)
+        if not position.is_open():
+            # closed positions get no more tp/sl updates
+            self.tpsl.forget(id)
+        return position
+
+    def forget_position(self, position):
+        """Drop the per position state of a position evicted from the book"""
+        self.tpsl.forget(position.id)
+        self.loaded_watermarks.pop(position.id, None)
+
+    def get_position(self, position_id):
+        """returns a position from the live book or the archive, None if unknown"""
+        return self.positions.find(position_id)
 
     def parse_order_changed(self, message):
         """{'instrument_id_escape': 'USDNOK', 'basic_stoplimit_amount': 68.0, 'take_profit_price': None, 'stop_lose_price': None, 'tpsl_extra': None, 'instrument_strike_value': None, 'instrument_type': 'forex', 'instrument_id': 'USDNOK', 'instrument_underlying': 'USDNOK', 'instrument_active_id': 168, 'instrument_expiration': None, 'instrument_strike': None, 'instrument_dir': None, 'id': 197997486, 'user_id': 25309108, 'user_balance_id': 43902542, 'user_balance_type': 4, 'position_id': 105120553, 'create_at': 1512136901477, 'update_at': 1512136902059, 'execute_at': 1512136902080, 'side': 'sell', 'type': 'market', 'status': 'filled', 'execute_status': 'trade', 'count': 410.19, 'leverage': 50, 'underlying_price': 8.28878, 'avg_price': 8.28878, 'avg_price_enrolled': 8.28878, 'client_platform_id': 9, 'limit_price': 0.0, 'stop_price': 0.0, 'currency': 'USD', 'margin': 67.999493, 'spread': 0.002149999999998542, 'commission_amount': 0.0, 'commission_amount_enrolled': 0.0, 'extra_data': {'amount': 68000000, 'auto_margin_call': False, 'paid_for_commission': 3.2978681700337323e-229, 'use_token_for_commission': False, 'paid_for_commission_enrolled': 3.2978681700337323e-229}, 'time_in_force': 'good_till_cancel', 'time_in_force_date': None, 'index': 268787403}"""
         """{'instrument_id_escape': 'GBPAUD', 'basic_stoplimit_amount': None, 'take_profit_price': None, 'stop_lose_price': None, 'tpsl_extra': None, 'instrument_strike_value': None, 'instrument_type': 'forex', 'instrument_id': 'GBPAUD', 'instrument_underlying': 'GBPAUD', 'instrument_active_id': 104, 'instrument_expiration': None, 'instrument_strike': None, 'instrument_dir': None, 'id': 198025634, 'user_id': 25309108, 'user_balance_id': 43902542, 'user_balance_type': 4, 'position_id': 105107359, 'create_at': 1512137346595, 'update_at': 1512137346595, 'execute_at': None, 'side': 'buy', 'type': 'stop', 'status': 'new', 'execute_status': 'new', 'count': 1937.89, 'leverage': 50, 'underlying_price': None, 'avg_price': None, 'avg_price_enrolled': None, 'client_platform_id': 0, 'limit_price': None, 'stop_price': 1.778058, 'currency': 'USD', 'margin': None, 'spread': None, 'commission_amount': None, 'commission_amount_enrolled': None, 'extra_data': {'use_token_for_commission': False, 'auto_margin_call': False}, 'time_in_force': 'good_till_cancel', 'time_in_force_date': None, 'index': 268830312}"""
         pos_id = message["position_id"]
+        self.orders.on_order_changed(message)
+        if self.metrics is not None and message.get("execute_at"):
+            self.metrics.order_executed(message["id"], message["execute_at"])
         if pos_id in self.positions:
             self.positions[pos_id].update_order(message)
+        if message["type"] in ("stop", "limit") and message["status"] != "canceled":
+            # a new stop/limit order is the result of a change-tpsl
+            self.tpsl.confirm(pos_id)
 
     def parse_tpsl_changed(self, message):
         """{'name': 'change-tpsl', 'version': '1.0', 'body': {'position_id': 105112592, 'take_profit': 1.5644423049999998, 'stop_lose': 1.5669506169999998, 'extra': {'stop_lose_type': 'percent', 'take_profit_type': 'percent'}}}}"""
-        # print(self.positions[message['position_id']].get_data())
-        # pass
+        body = message.get("body", message)
+        if "position_id" in body:
+            self.tpsl.confirm(body["position_id"])
 
     def parse_positions_message(self, message):
         if message["total"] > 0:
@@ -220,17 +528,30 @@ class IQOption():
 
     def parse_new_chart_data_message(self, message):
         symbol = message["symbol"]
+        if self.metrics is not None:
+            self.metrics.quote_latency.record(time.time() - message["time"])
+        if message.get("active_id") in self.conflated_markets:
+            self.conflator.add(symbol, message)
+            return
+        self.store_quote(symbol, message)
+
+    def store_quote(self, symbol, message):
+        """Store a (possibly conflated) quote in market_data, last_market_data and spread"""
+
         # remove some redundant data
         message.pop("symbol", None)
         message.pop("active_id", None)
-        self.logger.debug("parse_new_chart_data_message: {0}".format(message))
-        if symbol in self.market_data:
-            self.market_data[symbol][message["time"]] = message
-        else:
-            self.market_data[symbol] = {message["time"]: message}
-
-        self.last_market_data[symbol] = message
-        self.spread[symbol] = (message['ask']-message['bid'])/message['value']
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("parse_new_chart_data_message: {0}".format(message))
+        with self._quote_lock:
+            if self.tracer is not None:
+                self.tracer.quote(symbol, message)
+            self.market_data.append(symbol, message)
+            if self.candles is not None:
+                self.candles.add(symbol, message)
+
+            self.last_market_data[symbol] = message
+            self.spread[symbol] = (message['ask']-message['bid'])/message['value']
 
     def get_latest_chart_data(self, symbol):
         """returns something like this: {'active_id': 102, 'symbol': 'GBPCAD', 'bid': 1.7419499999999999, 'ask': 1.74222, 'value': 1.742085, 'volume': 0, 'time': 1512058717, 'closed': False, 'show_value': 1.742085, 'buy': 1.74222, 'sell': 1.7419499999999999}"""
@@ -241,35 +562,47 @@ class IQOption():
 
     def get_chart_data_for_time(self, time='last'):
         if time == 'last':
-            time = sorted(self.market_data[list(self.market_data.keys())[-1]].keys())[-1]
-        return {x:self.market_data.get(x).get(time) for x in self.market_data.keys()}
+            time = self.market_data.latest_time
+        return {x: self.market_data[x].get(time) for x in self.market_data.keys()}
+
+    def get_market_snapshot(self, time='last', symbols=None):
+        """returns the last known bid/ask/value of all (or the given) symbols at `time` as aligned numpy arrays, see MarketData.snapshot"""
+        return self.market_data.snapshot(time, symbols)
+
+    def get_candles(self, symbol, interval, include_open=False):
+        """returns the OHLCV candles of `symbol` for one of the `candle_intervals` as dict of numpy arrays (keys: time, open, high, low, close, volume, ticks)"""
+        return self.candles.history(symbol, interval, include_open)
+
+    def get_chart_data_between(self, symbol, start=None, end=None):
+        """returns the stored ticks of `symbol` with `start <= time <= end` as dict of numpy arrays (keys: time, bid, ask, value, volume)"""
+        return self.market_data.between(symbol, start, end)
 
     def parse_top_assets_message(self, message):
         instrument_type = message["instrument_type"]
         temp = {}
         for ele in message["data"]:
             temp[ele["active_id"]] = ele["active_id"]
-        self.__dict__["{}_top_assets".format(instrument_type)] = temp
+        self.instrument_cache.set_top_assets(instrument_type, temp)
 
     def parse_available_leverages(self, message):
-        self.logger.debug("parse_available_leverages: {}".format(message))
+        if self.logger.isEnabledFor(logging.DEBUG):
+            self.logger.debug("parse_available_leverages: {}".format(message))
         instrument_type = message["instrument_type"]
         temp = {}
         for ele in message["leverages"]:
             temp[self.id_to_instruments[ele["active_id"]]] = ele["regulated"]
-        self.__dict__["{}_leverages".format(instrument_type)] = temp
+        self.instrument_cache.set_leverages(instrument_type, temp)
 
     def parse_instruments_message(self, message):
         try:
             instrument_type = message["type"]
-            self.logger.debug("parse_instruments_message: {}".format(message))
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("parse_instruments_message: {}".format(message))
             temp = {}
             for ele in message["instruments"]:
                 temp[ele["id"]] = ele["active_id"]
-                self.instruments_to_id[ele["id"]] = ele["active_id"]
-                self.id_to_instruments[ele["active_id"]] = ele["id"]
-            self.__dict__["{}_instruments".format(instrument_type)] = temp
-            self.get_leverage(instrument_type, list(temp.values()))
+            self.instrument_cache.set_instruments(instrument_type, temp)
+            self._leverage_requests[instrument_type] = self.get_leverage(instrument_type, list(temp.values()))
         except Exception:
             self.logger.exception("error parse_instruments_message {}".format(message))
 
@@ -289,89 +622,144 @@ class IQOption():
         self.parse_account_info(self.session.request(url=self.getprofile_url, method="GET").json())
 
     def get_top_assets(self):
-        for ele in self.top_assets_categories:
-            self.send_socket_message("sendMessage", {"name": "get-top-assets", "version": "1.1", "body": {"instrument_type": ele}})
+        """Request the top assets, returns the request futures"""
+        return [self.send_socket_message("sendMessage", {"name": "get-top-assets", "version": "1.1", "body": {"instrument_type": ele}}) for ele in self.top_assets_categories]
 
     def get_instruments(self):
-        for ele in self.instruments_categories:
-            self.send_socket_message("sendMessage", {"name": "get-instruments", "version": "1.0", "body": {"type": ele}})
+        """Request the instruments, returns the request futures"""
+        return [self.send_socket_message("sendMessage", {"name": "get-instruments", "version": "1.0", "body": {"type": ele}}) for ele in self.instruments_categories]
 
     def get_positions(self, instrument_type=""):
-        if instrument_type != "":
-            self.send_socket_message("sendMessage", {"name": "get-positions", "version": "1.0", "body": {"user_balance_id": self.active_account_id, "instrument_type": instrument_type}})
-            return
-        for instrument_type in self.instruments_categories:
-            self.send_socket_message("sendMessage", {"name": "get-positions", "version": "1.0", "body": {"user_balance_id": self.active_account_id, "instrument_type": instrument_type}})
+        """Request the positions of one or all instrument types, returns the request futures"""
+        instrument_types = [instrument_type] if instrument_type != "" else self.instruments_categories
+        return [self.send_socket_message("sendMessage", {"name": "get-positions", "version": "1.0", "body": {"user_balance_id": self.active_account_id, "instrument_type": ele}}) for ele in instrument_types]
 
     def get_open_positions(self, market=None):
-        tmp = self.positions
-        tmp = sorted(tmp.values(), key=lambda x: x.id)
-        if market is None:
-            return [pos for pos in tmp if pos.is_open()]
-        else:
-            return [pos for pos in tmp if pos.is_open() and pos.instrument_id == market]
+        return self.positions.open_positions(market)
+
+    def evaluate_open_positions(self, percent_buffer=None, market=None):
+        """current win, stop loss percent and (with `percent_buffer`) stoploss/takeprofit prices of all open positions against the latest quotes, see portfolio.evaluate_positions"""
+        positions = self.get_open_positions(market)
+        quotes = [self.last_market_data.get(pos.instrument_id, {}) for pos in positions]
+        bid = [quote.get("bid", float("nan")) for quote in quotes]
+        ask = [quote.get("ask", float("nan")) for quote in quotes]
+        return evaluate_positions(positions, bid, ask, percent_buffer)
 
     def get_leverage(self, instrument_type, actives):
-        self.send_socket_message("sendMessage", {"name": "get-available-leverages", "version": "2.0", "body": {"instrument_type": instrument_type, "actives": json.dumps(actives)}})
+        return self.send_socket_message("sendMessage", {"name": "get-available-leverages", "version": "2.0", "body": {"instrument_type": instrument_type, "actives": json.dumps(actives)}})
 
-    def subscribe_market(self, market_name=None, market_id=None):
+    def subscribe_market(self, market_name=None, market_id=None, conflate=False):
+        """Subscribe to quotes, with `conflate=True` quotes are merged and stored every `conflation_interval` seconds"""
         if market_name:
             market_id = self.instruments_to_id.get(market_name)
-        self.send_socket_message("subscribeMessage", {"name": "quote-generated", "version": "1.0", "params": {"routingFilters": {"active_id": market_id}}})
+        if conflate:
+            self.conflated_markets.add(market_id)
+            self.start_conflation()
+        self.subscriptions.add(market_id)
+        self.send_subscription("subscribeMessage", market_id)
 
     def unsubscribe_market(self, market_name=None, market_id=None):
         if market_name:
             market_id = self.instruments_to_id.get(market_name)
-        self.send_socket_message("unsubscribeMessage", {"name": "quote-generated", "version": "1.0", "params": {"routingFilters": {"active_id": market_id}}})
+        self.subscriptions.discard(market_id)
+        self.send_subscription("unsubscribeMessage", market_id)
+        if market_id in self.conflated_markets:
+            self.conflated_markets.discard(market_id)
+            self.conflator.flush()
+
+    def send_subscription(self, name, market_id):
+        self.send_socket_message(name, {"name": "quote-generated", "version": "1.0", "params": {"routingFilters": {"active_id": market_id}}})
+
+    def start_conflation(self):
+        self.conflator.start()
 
     def resubscribe_market(self, market_name=None, market_id=None):
+        conflate = (self.instruments_to_id.get(market_name) if market_name else market_id) in self.conflated_markets
         self.unsubscribe_market(market_name, market_id)
         time.sleep(0.2)
-        self.subscribe_market(market_name, market_id)
+        self.subscribe_market(market_name, market_id, conflate)
 
     def buy_forex(self, amount, market, leverage, side):
-        if market not in self.forex_instruments:
-            self.logger.warning("invalid market in buy_forex: {}".format(market))
-            return
-        if leverage not in self.forex_leverages[market]:
-            self.logger.warning("invalid leverage in buy_forex: {}".format(leverage))
+        error = self.instrument_cache.check_order("forex", market, leverage)
+        if error is not None:
+            self.logger.warning("invalid order in buy_forex: {}".format(error))
             return
-        # "{"name":"sendMessage","request_id":"1511993239_839844713","msg":{"name":"place-order-temp","version":"3.0","body":{"user_balance_id":43902542,"client_platform_id":"9","instrument_type":"forex","instrument_id":"EURUSD","side":"buy","type":"market","amount":1,"leverage":500,"limit_price":0,"stop_price":0,"use_token_for_commission":false}}}"
         self.logger.info("Buying {} of {} with direction {} and leverage {}".format(amount, market, side, leverage))
-        self.send_socket_message("sendMessage", {
-                                  "name": "place-order-temp",
-                                  "version": "3.0",
-                                  "body": {
-                                      "user_balance_id": self.active_account_id,
-                                      "client_platform_id": self.client_platform_id,
-                                      "instrument_type": "forex",
-                                      "instrument_id": market,
-                                      "side": side,
-                                      "type": "market",
-                                      "amount": amount,
-                                      "leverage": leverage,
-                                      "limit_price": 0,
-                                      "stop_price": 0,
-                                      "use_token_for_commission": False
-                                  }})
+        return self.send_socket_message("sendMessage", {"name": "place-order-temp", "version": "3.0", "body": self.order_body({
+            "instrument_id": market, "side": side, "amount": amount, "leverage": leverage})})
+
+    def order_body(self, spec):
+        # "{"name":"sendMessage","request_id":"1511993239_839844713","msg":{"name":"place-order-temp","version":"3.0","body":{"user_balance_id":43902542,"client_platform_id":"9","instrument_type":"forex","instrument_id":"EURUSD","side":"buy","type":"market","amount":1,"leverage":500,"limit_price":0,"stop_price":0,"use_token_for_commission":false}}}"
+        return {
+            "user_balance_id": self.active_account_id,
+            "client_platform_id": self.client_platform_id,
+            "instrument_type": spec.get("instrument_type", "forex"),
+            "instrument_id": spec["instrument_id"],
+            "side": spec["side"],
+            "type": spec.get("type", "market"),
+            "amount": spec["amount"],
+            "leverage": spec["leverage"],
+            "limit_price": spec.get("limit_price", 0),
+            "stop_price": spec.get("stop_price", 0),
+            "use_token_for_commission": spec.get("use_token_for_commission", False)
+        }
+
+    def submit_orders(self, specs):
+        """Validate and send many orders back to back, returns one future per spec (in order).
+
+        A spec is a dict with an `action`: `open` (default, keys of order_body), `close`
+        (`position_id`) or `cancel` (`order_id`). The futures resolve with the filled (limit/stop:
+        accepted) or canceled order, or the closed Position, and fail with OrderError.
+        """
+
+        futures = []
+        for spec in specs:
+            action = spec.get("action", "open")
+            if action == "open":
+                futures.append(self.open_order(spec))
+            elif action == "close":
+                futures.append(self.close_position(spec["position_id"]))
+            elif action == "cancel":
+                futures.append(self.cancel_order(spec["order_id"]))
+            else:
+                futures.append(failed_future(OrderError("unknown action {}".format(action))))
+        return futures
+
+    def open_order(self, spec):
+        """Place an order (see order_body), returns the future of the order, see submit_orders"""
+
+        error = check_order(spec, self.instrument_cache)
+        if error is not None:
+            self.logger.warning("invalid order {}: {}".format(spec, error))
+            return failed_future(OrderError(error))
+        request = self.send_socket_message("sendMessage", {"name": "place-order-temp", "version": "3.0", "body": self.order_body(spec)})
+        return self.orders.track_open(request, spec.get("type", "market"))
+
+    def close_position(self, position_id):
+        """Close an open position, returns the future of the closed position"""
+
+        position = self.positions.get(position_id)
+        if position is None or not position.is_open():
+            return failed_future(OrderError("position {} is not open".format(position_id)))
+        future = self.orders.expect_close(position_id)
+        self.orders.attach(self.send_socket_message("sendMessage", {"name": "close-position", "version": "1.0", "body": {"position_id": position_id}}, ack=True), future)
+        return future
+
+    def cancel_order(self, order_id):
+        """Cancel a pending limit/stop order, returns the future of the canceled order"""
+
+        future = self.orders.expect_cancel(order_id)
+        self.orders.attach(self.send_socket_message("sendMessage", {"name": "cancel-order", "version": "1.0", "body": {"order_id": order_id}}, ack=True), future)
+        return future
 
     def update_stoploss(self, position_id, stop_lose_value, take_profit_value=None):
-        if position_id in self.stoploss_update and time.time() - self.stoploss_update[position_id]["time"] < 0.5:
-            self.logger.debug("skipping stop loss update, last update less than 500ms away")
-            return
-        counter = 0
-        if position_id in self.stoploss_update:
-            if (
-                    self.stoploss_update[position_id]["take_profit"] == take_profit_value and
-                    self.stoploss_update[position_id]["stop_lose"] == stop_lose_value
-                ):
-                counter = self.stoploss_update[position_id]["counter"] + 1
-                self.logger.info("maybe lost position sl/tp orders? Counting {}".format(counter))
-
-        self.stoploss_update[position_id] = {'time': time.time(), "take_profit": take_profit_value, "stop_lose": stop_lose_value, "counter": counter}
-        self.logger.info("stop loss: {} -> {}:{}".format(position_id, stop_lose_value, take_profit_value))
-        self.send_socket_message("sendMessage", {"name": "change-tpsl", "version": "1.0", "body": {"position_id": position_id, "take_profit": take_profit_value, "stop_lose": stop_lose_value, "extra": {"stop_lose_type": "percent", "take_profit_type": "percent"}}})
+        """Set stop loss/take profit (percent) of a position, sent by the tp/sl scheduler within its rate budget"""
+        self.start_tpsl()
+        self.tpsl.set(position_id, stop_lose_value, take_profit_value)
 
-        if counter > 5:
-            self.logger.info("parsing all positions for {}".format(self.positions[position_id].instrument_type))
-            self.get_positions(self.positions[position_id].instrument_type)
+    def start_tpsl(self):
+        self.tpsl.start()
+
+    def send_tpsl(self, position_id, stop_lose_value, take_profit_value):
+        self.logger.info("stop loss: {} -> {}:{}".format(position_id, stop_lose_value, take_profit_value))
+        return self.send_socket_message("sendMessage", {"name": "change-tpsl", "version": "1.0", "body": {"position_id": position_id, "take_profit": take_profit_value, "stop_lose": stop_lose_value, "extra": {"stop_lose_type": "percent", "take_profit_type": "percent"}}}, ack=True)
@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+from .position import Position
+from . import fastjson
+
+
+class PositionArchive():
+    """Append-only SQLite archive of closed positions (including their orders).
+
+        archive = PositionArchive("positions.sqlite")
+        archive.get(105120553)
+        archive.query(instrument_id="EURUSD", since=1512136901477)
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS positions ("
+                "id INTEGER PRIMARY KEY, instrument_type TEXT, instrument_id TEXT, "
+                "create_at INTEGER, close_at INTEGER, close_reason TEXT, data TEXT)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS positions_instrument ON positions (instrument_id, close_at)")
+            self._db.execute("CREATE INDEX IF NOT EXISTS positions_close_at ON positions (close_at)")
+
+    def __contains__(self, position_id):
+        with self._lock:
+            row = self._db.execute("SELECT 1 FROM positions WHERE id = ?", (position_id,)).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM positions").fetchone()[0]
+
+    def store(self, position):
+        """Archive a position, archiving the same id again replaces it"""
+
+        data = position.get_data()
+        row = (
+            position.id, data.get("instrument_type"), data.get("instrument_id"),
+            data.get("create_at"), data.get("close_at"), data.get("close_reason"), fastjson.dumps(data),
+        )
+        with self._lock, self._db:
+            self._db.execute("INSERT OR REPLACE INTO positions VALUES (?, ?, ?, ?, ?, ?, ?)", row)
+
+    def get(self, position_id):
+        """Archived position or None"""
+
+        with self._lock:
+            row = self._db.execute("SELECT data FROM positions WHERE id = ?", (position_id,)).fetchone()
+        return self._load(row[0]) if row is not None else None
+
+    def query(self, instrument_id=None, instrument_type=None, close_reason=None, since=None, until=None, limit=None):
+        """Archived positions matching all given filters (`since`/`until` compare close_at in ms), ordered by close_at"""
+
+        conditions = []
+        args = []
+        for column, value in (("instrument_id", instrument_id), ("instrument_type", instrument_type), ("close_reason", close_reason)):
+            if value is not None:
+                conditions.append("{} = ?".format(column))
+                args.append(value)
+        if since is not None:
+            conditions.append("close_at >= ?")
+            args.append(since)
+        if until is not None:
+            conditions.append("close_at <= ?")
+            args.append(until)
+        sql = "SELECT data FROM positions"
+        if conditions:
+            sql += " WHERE " + " AND ".join(conditions)
+        sql += " ORDER BY close_at"
+        if limit is not None:
+            sql += " LIMIT ?"
+            args.append(limit)
+        with self._lock:
+            rows = self._db.execute(sql, args).fetchall()
+        return [self._load(row[0]) for row in rows]
+
+    def _load(self, data):
+        data = fastjson.loads(data)
+        state = dict((k, data.pop(k)) for k in Position.__slots__ if k not in Position._fields and k in data)
+        position = Position(data)
+        for k, v in state.items():
+            setattr(position, k, v)
+        return position
+
+    def close(self):
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,108 @@
+from collections import OrderedDict
+from collections.abc import Mapping
+from .position import Position
+
+
+class PositionBook(Mapping):
+    """Read-only `{position id: Position}` with indexes of open and closed positions.
+
+    The indexes are maintained by `update`, so looking up the open positions
+    (of one instrument) does not scan the whole position history.
+
+    With `keep_closed` only that many recently closed or updated positions stay
+    in the book, older ones are moved to `archive` (a PositionArchive, optional)
+    and passed to the `on_evict` callbacks. By default all positions are kept.
+    Only `update` changes that order, so reads from other threads never touch it.
+    """
+
+    def __init__(self, archive=None, keep_closed=None):
+        self.archive = archive
+        self.keep_closed = keep_closed
+        self.on_evict = []
+        self._positions = {}
+        self._open = {}
+        self._closed = OrderedDict()
+        self._open_by_instrument = {}
+
+    def __getitem__(self, position_id):
+        return self._positions[position_id]
+
+    def __iter__(self):
+        return iter(self._positions)
+
+    def __len__(self):
+        return len(self._positions)
+
+    def update(self, message):
+        """Create or update a position from a position-changed message, returns `(position, created)`"""
+
+        position_id = message["id"]
+        position = self._positions.get(position_id)
+        if position is None:
+            position = self.archive.get(position_id) if self.archive is not None else None
+            if position is None:
+                position = Position(message)
+                created = True
+            else:
+                position.update(message)
+                created = False
+            self._positions[position_id] = position
+            self._index(position)
+            return position, created
+        self._unindex(position)
+        try:
+            position.update(message)
+        finally:
+            self._index(position)
+        return position, False
+
+    def _index(self, position):
+        if position.is_open():
+            self._open[position.id] = position
+            self._open_by_instrument.setdefault(getattr(position, "instrument_id", None), {})[position.id] = position
+        else:
+            self._closed[position.id] = position
+            if self.keep_closed is not None and len(self._closed) > self.keep_closed:
+                self._evict()
+
+    def _evict(self):
+        while len(self._closed) > self.keep_closed:
+            position_id, position = self._closed.popitem(last=False)
+            del self._positions[position_id]
+            if self.archive is not None:
+                self.archive.store(position)
+            for callback in self.on_evict:
+                callback(position)
+
+    def _unindex(self, position):
+        if self._open.pop(position.id, None) is not None:
+            instrument = self._open_by_instrument.get(getattr(position, "instrument_id", None))
+            if instrument is not None:
+                instrument.pop(position.id, None)
+        self._closed.pop(position.id, None)
+
+    def open_positions(self, instrument_id=None):
+        """Open positions (of one instrument) ordered by id"""
+
+        if instrument_id is None:
+            positions = self._open.values()
+        else:
+            positions = self._open_by_instrument.get(instrument_id, {}).values()
+        return sorted(positions, key=lambda x: x.id)
+
+    def find(self, position_id):
+        """Position from the book or the archive, None if unknown"""
+
+        position = self._positions.get(position_id)
+        if position is None and self.archive is not None:
+            position = self.archive.get(position_id)
+        return position
+
+    def open_ids(self):
+        return set(self._open)
+
+    def closed_ids(self):
+        return set(self._closed)
+
+    def closed_positions(self):
+        return sorted(self._closed.values(), key=lambda x: x.id)
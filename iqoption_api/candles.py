@@ -0,0 +1,89 @@
+import logging
+import numpy
+from .market_data import RingBuffer
+
+
+class CandleAggregator():
+    """Incremental OHLCV candles of every symbol at several intervals (seconds).
+
+    Each quote updates the open candle of every interval in O(1), a candle is
+    closed (stored and passed to the `on_bar_close` callbacks) by the first
+    quote of a later interval. Closed candles are kept in ring buffers of
+    `capacity` candles per symbol and interval.
+    """
+
+    fields = ("time", "open", "high", "low", "close", "volume", "ticks")
+
+    def __init__(self, intervals=(1, 5, 60, 300), capacity=1000):
+        self.intervals = tuple(sorted(intervals))
+        self.capacity = capacity
+        self.logger = logging.getLogger("iqoption_api.candles")
+        self._callbacks = []
+        self._open = {}
+        self._closed = {}
+
+    def on_bar_close(self, callback):
+        """Call `callback(symbol, interval, candle)` for every closed candle"""
+        self._callbacks.append(callback)
+
+    def add(self, symbol, message):
+        """Update the candles of `symbol` with a quote (conflated quotes may carry high/low)"""
+
+        time = message["time"]
+        price = message["value"]
+        high = message.get("high", price)
+        low = message.get("low", price)
+        volume = message.get("volume", 0)
+        ticks = message.get("ticks", 1)
+        candles = self._open.get(symbol)
+        if candles is None:
+            candles = self._open[symbol] = [None] * len(self.intervals)
+            self._closed[symbol] = [RingBuffer(self.fields, self.capacity) for _ in self.intervals]
+        for k, interval in enumerate(self.intervals):
+            start = time - time % interval
+            candle = candles[k]
+            if candle is not None and start == candle[0]:
+                if high > candle[2]:
+                    candle[2] = high
+                if low < candle[3]:
+                    candle[3] = low
+                candle[4] = price
+                candle[5] += volume
+                candle[6] += ticks
+                continue
+            if candle is not None:
+                if start < candle[0]:
+                    # late quote of an already closed candle
+                    continue
+                self._close(symbol, k, candle)
+            candles[k] = [start, price, high, low, price, volume, ticks]
+
+    def _close(self, symbol, k, candle):
+        self._closed[symbol][k].append(candle)
+        if self._callbacks:
+            interval = self.intervals[k]
+            candle = dict(zip(self.fields, candle))
+            for callback in self._callbacks:
+                try:
+                    callback(symbol, interval, candle)
+                except Exception:
+                    self.logger.exception("error in bar close callback")
+
+    def current(self, symbol, interval):
+        """The open candle of `symbol` as dict or None"""
+
+        candles = self._open.get(symbol)
+        if candles is None or candles[self.intervals.index(interval)] is None:
+            return None
+        return dict(zip(self.fields, candles[self.intervals.index(interval)]))
+
+    def history(self, symbol, interval, include_open=False):
+        """Closed candles (oldest first) as dict of NumPy arrays, optionally followed by the open one"""
+
+        k = self.intervals.index(interval)
+        candles = self._closed[symbol][k]
+        history = dict((name, candles.column(name).copy()) for name in self.fields)
+        if include_open and self._open[symbol][k] is not None:
+            for name, value in zip(self.fields, self._open[symbol][k]):
+                history[name] = numpy.append(history[name], value)
+        return history
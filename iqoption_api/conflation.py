@@ -0,0 +1,58 @@
+import logging
+import threading
+from .periodic import Periodic
+
+
+class QuoteConflator():
+    """Merges the quotes of a symbol and delivers them at a fixed cadence.
+
+    The newest quote wins; the delivered quote additionally carries `ticks`
+    (number of merged quotes) and `high`/`low` of their `value`.
+    `deliver(symbol, quote)` is called from `flush`, either by the thread
+    started with `start` or by whoever calls `flush` periodically.
+    """
+
+    def __init__(self, deliver, interval=0.25):
+        self.deliver = deliver
+        self.interval = interval
+        self.logger = logging.getLogger("iqoption_api.conflation")
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flusher = Periodic(self.flush, interval, "iqoption-conflation", self.logger)
+
+    def add(self, symbol, message):
+        value = message["value"]
+        with self._lock:
+            state = self._pending.get(symbol)
+            if state is None:
+                self._pending[symbol] = [message, 1, value, value]
+            else:
+                state[0] = message
+                state[1] += 1
+                if value > state[2]:
+                    state[2] = value
+                elif value < state[3]:
+                    state[3] = value
+
+    def flush(self):
+        """Deliver every merged quote"""
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        for symbol, (message, ticks, high, low) in pending.items():
+            message["ticks"] = ticks
+            message["high"] = high
+            message["low"] = low
+            try:
+                self.deliver(symbol, message)
+            except Exception:
+                self.logger.exception("error delivering conflated quote of {}".format(symbol))
+
+    def start(self):
+        """Flush every `interval` seconds on a daemon thread"""
+        self._flusher.start()
+
+    def stop(self):
+        """Stop the flush thread and deliver what is still merged"""
+        self._flusher.stop()
+        self.flush()
@@ -0,0 +1,102 @@
+import logging
+import threading
+from queue import Queue
+from . import fastjson
+
+
+class EventQueue():
+    """Bounded queues of raw socket frames processed by a pool of worker threads.
+
+    The socket thread only enqueues, so slow handlers can not delay it.
+    Every worker has its own queue (of `maxsize` frames): the quotes of a symbol
+    always go to the same worker and all other frames (positions, orders,
+    replies) to the first one, so each symbol and each position is handled in
+    order. Overflow policies:
+
+    * `drop_stale_quotes`: at most one unprocessed quote per symbol is kept, a newer
+      quote replaces the waiting one (counted in `dropped`). Other frames are never
+      dropped, the socket thread waits if the queue is full of them.
+    * `block`: every frame is queued in order, the socket thread waits if the queue is full.
+    """
+
+    BLOCK = "block"
+    DROP_STALE_QUOTES = "drop_stale_quotes"
+    quote_message = "newChartData"
+
+    def __init__(self, handler, maxsize=10000, workers=1, overflow=DROP_STALE_QUOTES):
+        if overflow not in (self.BLOCK, self.DROP_STALE_QUOTES):
+            raise ValueError("unknown overflow policy: {}".format(overflow))
+        self.handler = handler
+        self.overflow = overflow
+        self.received = 0
+        self.dropped = 0
+        self.processed = 0
+        self.logger = logging.getLogger("iqoption_api.events")
+        self._queues = [Queue(maxsize) for _ in range(max(workers, 1))]
+        self._quotes = {}
+        self._lock = threading.Lock()
+        self._workers = []
+        for k in range(workers):
+            worker = threading.Thread(target=self._work, args=(self._queues[k],), name="iqoption-worker-{}".format(k))
+            worker.daemon = True
+            worker.start()
+            self._workers.append(worker)
+
+    def put(self, frame, name=None):
+        """Enqueue a raw frame, `name` is the already peeked message name"""
+
+        self.received += 1
+        if name == self.quote_message:
+            symbol = fastjson.peek_string(frame, "symbol")
+            if symbol is not None:
+                queue = self._queues[hash(symbol) % len(self._queues)]
+                if self.overflow == self.DROP_STALE_QUOTES:
+                    with self._lock:
+                        stale = symbol in self._quotes
+                        self._quotes[symbol] = frame
+                        if stale:
+                            self.dropped += 1
+                    if not stale:
+                        queue.put((symbol,))
+                else:
+                    queue.put(frame)
+                return
+        self._queues[0].put(frame)
+
+    def _work(self, queue):
+        while True:
+            item = queue.get()
+            if item is None:
+                break
+            if isinstance(item, tuple):
+                with self._lock:
+                    item = self._quotes.pop(item[0])
+            try:
+                self.handler(item)
+            except Exception:
+                self.logger.exception("error handling socket message")
+            with self._lock:
+                self.processed += 1
+
+    def stop(self):
+        """Let the workers finish the queued frames and exit"""
+
+        for queue in self._queues[:len(self._workers)]:
+            queue.put(None)
+        for worker in self._workers:
+            worker.join()
+        self._workers = []
+
+    def depth(self):
+        """Number of queued frames"""
+        return sum(queue.qsize() for queue in self._queues)
+
+    def stats(self):
+        return {
+            "depth": self.depth(),
+            "pending_quotes": len(self._quotes),
+            "received": self.received,
+            "dropped": self.dropped,
+            "processed": self.processed,
+            "workers": len(self._workers),
+        }
@@ -0,0 +1,55 @@
+"""JSON encoding for socket frames, uses orjson or ujson when installed and falls back to json"""
+
+try:
+    import orjson
+
+    backend = "orjson"
+    loads = orjson.loads
+
+    def dumps(obj):
+        return orjson.dumps(obj).decode("utf-8")
+
+except ImportError:
+    try:
+        import ujson
+
+        backend = "ujson"
+        loads = ujson.loads
+
+        def dumps(obj):
+            return ujson.dumps(obj, ensure_ascii=False, escape_forward_slashes=False)
+
+    except ImportError:
+        import json
+
+        backend = "json"
+        loads = json.loads
+
+        def dumps(obj):
+            return json.dumps(obj, separators=(",", ":"))
+
+NAME_PREFIX = '{"name":"'
+
+
+def peek_name(frame):
+    """Message name of a raw frame without decoding it, None if the frame is not laid out as `{"name":"...` """
+
+    if frame.startswith(NAME_PREFIX):
+        end = frame.find('"', len(NAME_PREFIX))
+        if end > 0:
+            return frame[len(NAME_PREFIX):end]
+    return None
+
+
+def peek_string(frame, key):
+    """First string value of `key` in a raw frame without decoding it, None if not found"""
+
+    prefix = '"{}":"'.format(key)
+    start = frame.find(prefix)
+    if start < 0:
+        return None
+    start += len(prefix)
+    end = frame.find('"', start)
+    if end < 0:
+        return None
+    return frame[start:end]
@@ -0,0 +1,116 @@
+import json
+import logging
+import os
+import threading
+import time
+
+# bump when the layout of the cache file changes, older files are ignored
+CACHE_VERSION = 1
+
+
+class InstrumentCache():
+    """Instrument, leverage and top asset metadata, shareable between accounts.
+
+    Written by the message parsers of every account using it, read by all of
+    them. Lookups are plain dicts, updates replace the per type tables at once.
+    """
+
+    def __init__(self):
+        self.instruments_to_id = {}
+        self.id_to_instruments = {}
+        self.instruments = {}
+        self.leverages = {}
+        self.top_assets = {}
+        # {(instrument type, instrument id): frozenset of leverages}, used to validate orders
+        self.tradable = {}
+        # loaded from a file, should be refreshed from the server
+        self.needs_refresh = False
+        self.logger = logging.getLogger("iqoption_api.instruments")
+        self._lock = threading.Lock()
+
+    def set_instruments(self, instrument_type, instruments):
+        """`instruments` is `{instrument id: active id}`"""
+
+        with self._lock:
+            for instrument_id, active_id in instruments.items():
+                self.instruments_to_id[instrument_id] = active_id
+                self.id_to_instruments[active_id] = instrument_id
+            self.instruments[instrument_type] = instruments
+
+    def set_leverages(self, instrument_type, leverages):
+        """`leverages` is `{instrument id: available leverages}`"""
+
+        with self._lock:
+            tradable = dict((key, value) for key, value in self.tradable.items() if key[0] != instrument_type)
+            for instrument_id, available in leverages.items():
+                tradable[(instrument_type, instrument_id)] = frozenset(available)
+            self.tradable = tradable
+            self.leverages[instrument_type] = leverages
+
+    def set_top_assets(self, instrument_type, top_assets):
+        self.top_assets[instrument_type] = top_assets
+
+    def has_instruments(self, instrument_types):
+        """True if instruments and leverages of all `instrument_types` are known"""
+        return all(t in self.instruments and t in self.leverages for t in instrument_types)
+
+    def has_top_assets(self, instrument_types):
+        return all(t in self.top_assets for t in instrument_types)
+
+    def check_order(self, instrument_type, instrument_id, leverage):
+        """Reason why an order can not be placed or None"""
+
+        available = self.tradable.get((instrument_type, instrument_id))
+        if available is None:
+            return "unknown instrument {} {}".format(instrument_type, instrument_id)
+        if leverage not in available:
+            return "leverage {} not available for {}".format(leverage, instrument_id)
+        return None
+
+    def lookup(self, name):
+        """Tables by their old attribute names: `forex_instruments`, `crypto_leverages`, `binary_top_assets`, ..."""
+
+        for suffix, tables in (("_instruments", self.instruments), ("_leverages", self.leverages), ("_top_assets", self.top_assets)):
+            if name.endswith(suffix):
+                return tables[name[:-len(suffix)]]
+        raise KeyError(name)
+
+    def save(self, path):
+        """Write all tables to `path` (atomically replaced)"""
+
+        data = {
+            "version": CACHE_VERSION,
+            "saved_at": time.time(),
+            "instruments": self.instruments,
+            "leverages": self.leverages,
+            # json keys are strings, the active ids are restored from the values
+            "top_assets": dict((k, list(v.values())) for k, v in self.top_assets.items()),
+        }
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp, path)
+
+    def load(self, path, ttl=None):
+        """Fill the tables from a file written by save, returns False if it is missing, of another version or older than `ttl` seconds"""
+
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return False
+        if data.get("version") != CACHE_VERSION:
+            self.logger.info("ignoring instrument cache {} of version {}".format(path, data.get("version")))
+            return False
+        age = time.time() - data["saved_at"]
+        if ttl is not None and age > ttl:
+            self.logger.info("ignoring instrument cache {}, {:.0f}s old".format(path, age))
+            return False
+        for instrument_type, instruments in data["instruments"].items():
+            self.set_instruments(instrument_type, instruments)
+        for instrument_type, leverages in data["leverages"].items():
+            self.set_leverages(instrument_type, leverages)
+        for instrument_type, top_assets in data["top_assets"].items():
+            self.set_top_assets(instrument_type, dict((active_id, active_id) for active_id in top_assets))
+        self.needs_refresh = True
+        return True
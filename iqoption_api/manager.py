@@ -0,0 +1,104 @@
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from .api import IQOption
+from .instruments import InstrumentCache
+
+
+class AccountManager():
+    """Several account sessions sharing one instrument/leverage/top asset cache.
+
+    Every account has its own HTTP session, websocket, positions and requests.
+    Only the first login downloads the instrument metadata, the others start
+    from the shared `instrument_cache`. With `share_market_data` the quotes are
+    stored once: only the first account (the feed) subscribes to markets and
+    all accounts read its `market_data`, `last_market_data` and `spread`.
+
+    `options` are passed to every IQOption, `add` can override them per account.
+    """
+
+    def __init__(self, host="iqoption.com", share_market_data=False, **options):
+        self.host = host
+        self.share_market_data = share_market_data
+        self.options = options
+        self.instrument_cache = InstrumentCache()
+        self.accounts = OrderedDict()
+        self.logger = logging.getLogger("iqoption_api.manager")
+
+    def __getitem__(self, username):
+        return self.accounts[username]
+
+    def __iter__(self):
+        return iter(self.accounts.values())
+
+    def __len__(self):
+        return len(self.accounts)
+
+    @property
+    def feed(self):
+        """The account receiving the shared quotes (the first one added)"""
+        return next(iter(self.accounts.values()), None)
+
+    def add(self, username, password, **options):
+        """Create the session of an account, call login_all (or its login) to connect it"""
+
+        kwargs = dict(self.options)
+        kwargs.update(options)
+        kwargs.setdefault("host", self.host)
+        account = IQOption(username, password, instrument_cache=self.instrument_cache, **kwargs)
+        feed = self.feed
+        if self.share_market_data and feed is not None:
+            account.market_data = feed.market_data
+            account.last_market_data = feed.last_market_data
+            account.spread = feed.spread
+            account.candles = feed.candles
+        self.accounts[username] = account
+        return account
+
+    def login_all(self, max_workers=8):
+        """Log all accounts in, returns `{username: successful}`.
+
+        The first login fills the instrument cache, the remaining ones run in parallel.
+        """
+
+        accounts = list(self.accounts.items())
+        if not accounts:
+            return {}
+        results = OrderedDict()
+        results[accounts[0][0]] = self._login(accounts[0][1])
+        if len(accounts) > 1:
+            with ThreadPoolExecutor(max_workers) as executor:
+                logins = [(username, executor.submit(self._login, account)) for username, account in accounts[1:]]
+                for username, login in logins:
+                    results[username] = login.result()
+        return results
+
+    def _login(self, account):
+        try:
+            return account.login()
+        except Exception:
+            self.logger.exception("login of {} failed".format(account.username))
+            return False
+
+    def subscribe_market(self, market_name=None, market_id=None, conflate=False):
+        """Subscribe the feed account (with share_market_data) or every account"""
+
+        accounts = [self.feed] if self.share_market_data else list(self.accounts.values())
+        for account in accounts:
+            if account is not None:
+                account.subscribe_market(market_name, market_id, conflate)
+
+    def unsubscribe_market(self, market_name=None, market_id=None):
+        accounts = [self.feed] if self.share_market_data else list(self.accounts.values())
+        for account in accounts:
+            if account is not None:
+                account.unsubscribe_market(market_name, market_id)
+
+    def close(self):
+        """Close the connections of all accounts"""
+
+        for account in self.accounts.values():
+            try:
+                account.stop_socket_connection()
+            except Exception:
+                self.logger.exception("error closing {}".format(account.username))
@@ -0,0 +1,237 @@
+import numpy
+from collections.abc import Mapping
+
+
+class RingBuffer():
+    """Preallocated fixed capacity column store, oldest rows get overwritten once full.
+
+    Every row is written twice (at `i` and `i + capacity`) so the live rows are
+    always one contiguous slice of the backing array and can be read without copying.
+    """
+
+    def __init__(self, fields, capacity, dtype=numpy.float64):
+        if capacity < 1:
+            raise ValueError("capacity has to be at least 1")
+        self.fields = tuple(fields)
+        self.capacity = capacity
+        self._columns = dict((name, k) for k, name in enumerate(self.fields))
+        self._data = numpy.zeros((len(self.fields), capacity * 2), dtype=dtype)
+        self._next = 0
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, row):
+        i = self._next
+        self._data[:, i] = row
+        self._data[:, i + self.capacity] = row
+        self._next = (i + 1) % self.capacity
+        if self._size < self.capacity:
+            self._size += 1
+
+    def discard(self, count):
+        """Drop the `count` oldest rows"""
+        self._size = max(0, self._size - count)
+
+    def clear(self):
+        self._next = 0
+        self._size = 0
+
+    def bounds(self):
+        """Physical start and stop of the live rows"""
+        start = (self._next - self._size) % self.capacity
+        return start, start + self._size
+
+    def column(self, name):
+        """Read-only view on one column, oldest row first"""
+        start, stop = self.bounds()
+        view = self._data[self._columns[name], start:stop]
+        view.flags.writeable = False
+        return view
+
+    def row(self, index):
+        """Row at chronological `index` (negative indices count from the newest)"""
+        if index < 0:
+            index += self._size
+        if not 0 <= index < self._size:
+            raise IndexError("ring buffer index out of range")
+        start, _ = self.bounds()
+        return self._data[:, start + index]
+
+
+class TickStore(Mapping):
+    """Bounded tick history of one symbol.
+
+    Behaves like the old `{time: tick}` dict (read-only), a tick being
+    `{'time', 'bid', 'ask', 'value', 'volume'}`. Several ticks can share a time,
+    the mapping holds the last one per time, `tick_count` counts all of them.
+    When a `window` (seconds) is given ticks older than `latest_time - window`
+    are dropped as well.
+    """
+
+    fields = ("time", "bid", "ask", "value", "volume")
+
+    def __init__(self, capacity, window=None):
+        self.window = window
+        self._ticks = RingBuffer(self.fields, capacity)
+
+    @property
+    def capacity(self):
+        return self._ticks.capacity
+
+    @property
+    def latest_time(self):
+        """Time of the newest tick or None"""
+        if not len(self._ticks):
+            return None
+        return self._ticks.row(-1)[0]
+
+    def append(self, message):
+        self._ticks.append((message["time"], message["bid"], message["ask"], message["value"], message.get("volume", 0)))
+        if self.window is not None:
+            times = self._ticks.column("time")
+            cutoff = times[-1] - self.window
+            if times[0] < cutoff:
+                self._ticks.discard(int(numpy.searchsorted(times, cutoff, side="left")))
+
+    def latest(self):
+        """Newest tick as dict or None"""
+        if not len(self._ticks):
+            return None
+        return self._to_dict(self._ticks.row(-1))
+
+    def _to_dict(self, row):
+        return dict(zip(self.fields, row.tolist()))
+
+    def _index(self, time):
+        """Chronological index of the last tick at `time` or -1"""
+        times = self._ticks.column("time")
+        i = int(numpy.searchsorted(times, time, side="right")) - 1
+        if i < 0 or times[i] != time:
+            return -1
+        return i
+
+    def asof(self, time):
+        """Last known tick at or before `time` or None"""
+        times = self._ticks.column("time")
+        i = int(numpy.searchsorted(times, time, side="right")) - 1
+        if i < 0:
+            return None
+        return self._to_dict(self._ticks.row(i))
+
+    def __getitem__(self, time):
+        i = self._index(time)
+        if i < 0:
+            raise KeyError(time)
+        return self._to_dict(self._ticks.row(i))
+
+    def __contains__(self, time):
+        return self._index(time) >= 0
+
+    def __iter__(self):
+        return iter(numpy.unique(self._ticks.column("time")).tolist())
+
+    def __len__(self):
+        times = self._ticks.column("time")
+        if not len(times):
+            return 0
+        # times are sorted, count the distinct ones like __iter__
+        return 1 + int(numpy.count_nonzero(times[1:] != times[:-1]))
+
+    def tick_count(self):
+        """Number of stored ticks, including ticks sharing a time"""
+        return len(self._ticks)
+
+    def times(self):
+        """Time of every stored tick as NumPy array (oldest first)"""
+        return self._ticks.column("time").copy()
+
+    def between(self, start=None, end=None):
+        """All ticks with `start <= time <= end` as dict of NumPy arrays"""
+        times = self._ticks.column("time")
+        lo = 0 if start is None else int(numpy.searchsorted(times, start, side="left"))
+        hi = len(times) if end is None else int(numpy.searchsorted(times, end, side="right"))
+        return dict((name, self._ticks.column(name)[lo:hi].copy()) for name in self.fields)
+
+
+class MarketData(Mapping):
+    """Read-only `{symbol: TickStore}` view on all received quotes.
+
+    The newest time/bid/ask/value of every symbol is additionally kept in one
+    aligned array (slot per symbol in order of first appearance), so the
+    latest snapshot never touches the tick history.
+    """
+
+    snapshot_fields = ("time", "bid", "ask", "value")
+
+    def __init__(self, capacity=20000, window=None):
+        self.capacity = capacity
+        self.window = window
+        self.latest_time = None
+        self._stores = {}
+        self._symbols = []
+        self._slots = {}
+        self._last = numpy.full((len(self.snapshot_fields), 16), numpy.nan)
+
+    def __getitem__(self, symbol):
+        return self._stores[symbol]
+
+    def __iter__(self):
+        return iter(self._stores)
+
+    def __len__(self):
+        return len(self._stores)
+
+    def append(self, symbol, message):
+        """Store a quote, only meant to be called by the api"""
+        store = self._stores.get(symbol)
+        if store is None:
+            store = self._stores[symbol] = TickStore(self.capacity, self.window)
+            self._add_slot(symbol)
+        store.append(message)
+        self._last[:, self._slots[symbol]] = (message["time"], message["bid"], message["ask"], message["value"])
+        if self.latest_time is None or message["time"] > self.latest_time:
+            self.latest_time = message["time"]
+
+    def _add_slot(self, symbol):
+        slot = len(self._symbols)
+        if slot == self._last.shape[1]:
+            grown = numpy.full((self._last.shape[0], slot * 2), numpy.nan)
+            grown[:, :slot] = self._last
+            self._last = grown
+        self._symbols.append(symbol)
+        self._slots[symbol] = slot
+
+    def between(self, symbol, start=None, end=None):
+        return self._stores[symbol].between(start, end)
+
+    def latest_times(self):
+        """{symbol: time of its newest tick}"""
+        times = self._last[0, :len(self._symbols)].tolist()
+        return dict(zip(self._symbols, times))
+
+    def snapshot(self, time="last", symbols=None):
+        """Aligned last known time/bid/ask/value of `symbols` (default all) at `time`.
+
+        Returns `{'symbol': [...], 'time': array, 'bid': array, 'ask': array, 'value': array}`,
+        symbols without a tick at or before `time` are NaN. `time='last'` is
+        served from the latest index, any other time does one binary search per symbol.
+        """
+        if symbols is None:
+            symbols = list(self._symbols)
+        snapshot = {"symbol": symbols}
+        if time == "last":
+            slots = [self._slots.get(symbol, -1) for symbol in symbols]
+            values = numpy.full((len(self.snapshot_fields), len(symbols)), numpy.nan)
+            known = [k for k, slot in enumerate(slots) if slot >= 0]
+            values[:, known] = self._last[:, [slots[k] for k in known]]
+        else:
+            values = numpy.full((len(self.snapshot_fields), len(symbols)), numpy.nan)
+            for k, symbol in enumerate(symbols):
+                tick = self._stores[symbol].asof(time) if symbol in self._stores else None
+                if tick is not None:
+                    values[:, k] = [tick[name] for name in self.snapshot_fields]
+        for k, name in enumerate(self.snapshot_fields):
+            snapshot[name] = values[k]
+        return snapshot
@@ -0,0 +1,195 @@
+"""Counters and latency histograms of the socket hot paths, see IQOption(..., metrics=True)"""
+
+import json
+import threading
+import time
+
+# sub buckets per power of two, values are kept with about 1/16 (6%) relative precision
+SUB_BITS = 4
+SUB_BUCKETS = 1 << SUB_BITS
+
+
+class Histogram():
+    """HDR style histogram of non negative values with constant relative precision.
+
+    Values are scaled by `scale` to integers (microseconds for seconds) and
+    counted in log-linear buckets: exact below `2 * SUB_BUCKETS`, above that
+    `SUB_BUCKETS` buckets per power of two. Recording is O(1) and the memory
+    grows only with the range of the values.
+    """
+
+    quantiles = (0.5, 0.9, 0.99, 0.999)
+
+    def __init__(self, scale=1e6):
+        self.scale = scale
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _index(value):
+        bits = value.bit_length()
+        if bits <= SUB_BITS + 1:
+            return value
+        shift = bits - SUB_BITS - 1
+        return (shift << SUB_BITS) + (value >> shift)
+
+    @staticmethod
+    def _lower(index):
+        if index < 2 * SUB_BUCKETS:
+            return index
+        shift = (index >> SUB_BITS) - 1
+        return (index - (shift << SUB_BITS)) << shift
+
+    def record(self, value):
+        scaled = int(value * self.scale)
+        if scaled < 0:
+            # clock skew between server and client
+            scaled = 0
+        index = self._index(scaled)
+        with self._lock:
+            self._buckets[index] = self._buckets.get(index, 0) + 1
+            self.count += 1
+            self.sum += value
+            if self.min is None or value < self.min:
+                self.min = value
+            if self.max is None or value > self.max:
+                self.max = value
+
+    def percentile(self, q):
+        """Upper bound of the bucket holding the `q` quantile (0..1), None if empty"""
+
+        with self._lock:
+            buckets = sorted(self._buckets.items())
+            count = self.count
+        if not count:
+            return None
+        rank = max(1, int(q * count + 0.5))
+        seen = 0
+        for index, n in buckets:
+            seen += n
+            if seen >= rank:
+                upper = index if index < 2 * SUB_BUCKETS else self._lower(index + 1) - 1
+                return min(upper / self.scale, self.max)
+        return self.max
+
+    def reset(self):
+        with self._lock:
+            self._buckets = {}
+            self.count = 0
+            self.sum = 0.0
+            self.min = None
+            self.max = None
+
+    def snapshot(self):
+        snapshot = {"count": self.count, "sum": self.sum, "min": self.min, "max": self.max}
+        for q in self.quantiles:
+            snapshot["p{:g}".format(q * 100)] = self.percentile(q)
+        return snapshot
+
+
+class Metrics():
+    """Message counters and latency histograms filled by IQOption.
+
+    * `received` / `sent`: frames per message name
+    * `quote_latency`: handler time minus the server `time` of newChartData
+    * `parse_time`: decode and handler time per message name
+    * `heartbeat_lag`: receive time minus the server time of heartbeats
+    * `order_fill`: place-order-temp sent until the `execute_at` of its order
+    * `backlog`: frames waiting in the event queue (workers only)
+    """
+
+    def __init__(self):
+        self.started_at = time.time()
+        self.received = {}
+        self.sent = {}
+        self.quote_latency = Histogram()
+        self.heartbeat_lag = Histogram()
+        self.order_fill = Histogram()
+        self.backlog = Histogram(scale=1)
+        self.parse_time = {}
+        self._orders = {}
+        self._lock = threading.Lock()
+
+    def count_received(self, name):
+        self.received[name] = self.received.get(name, 0) + 1
+
+    def count_sent(self, name):
+        self.sent[name] = self.sent.get(name, 0) + 1
+
+    def record_parse_time(self, name, seconds):
+        histogram = self.parse_time.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.parse_time.setdefault(name, Histogram())
+        histogram.record(seconds)
+
+    def order_sent(self, future):
+        """Track a place-order-temp request future until its order is executed"""
+        future.add_done_callback(self._order_placed)
+
+    def _order_placed(self, future):
+        if future.exception() is None and isinstance(future.result(), dict) and "id" in future.result():
+            with self._lock:
+                self._orders[future.result()["id"]] = future.sent_at
+
+    def order_executed(self, order_id, execute_at):
+        """`execute_at` in milliseconds as sent in order-changed"""
+
+        with self._lock:
+            sent_at = self._orders.pop(order_id, None)
+        if sent_at is not None:
+            self.order_fill.record(execute_at / 1000.0 - sent_at)
+
+    def histograms(self):
+        return {
+            "quote_latency_seconds": self.quote_latency,
+            "heartbeat_lag_seconds": self.heartbeat_lag,
+            "order_fill_seconds": self.order_fill,
+            "socket_backlog_frames": self.backlog,
+        }
+
+    def snapshot(self):
+        """All metrics as JSON serializable dict"""
+
+        return {
+            "uptime": time.time() - self.started_at,
+            "received": dict(self.received),
+            "sent": dict(self.sent),
+            "histograms": dict((name, histogram.snapshot()) for name, histogram in self.histograms().items()),
+            "parse_time_seconds": dict((name, histogram.snapshot()) for name, histogram in list(self.parse_time.items())),
+        }
+
+    def to_json(self):
+        return json.dumps(self.snapshot())
+
+    def to_prometheus(self, prefix="iqoption"):
+        """All metrics in the Prometheus text exposition format, histograms as summaries"""
+
+        lines = []
+        for kind, counters in (("received", self.received), ("sent", self.sent)):
+            metric = "{}_messages_{}_total".format(prefix, kind)
+            lines.append("# TYPE {} counter".format(metric))
+            for name, count in sorted(counters.items(), key=lambda item: str(item[0])):
+                lines.append('{}{{message="{}"}} {}'.format(metric, name, count))
+        for name, histogram in sorted(self.histograms().items()):
+            self._summary(lines, "{}_{}".format(prefix, name), histogram)
+        metric = "{}_parse_time_seconds".format(prefix)
+        lines.append("# TYPE {} summary".format(metric))
+        for name, histogram in sorted(self.parse_time.items()):
+            self._summary(lines, metric, histogram, 'message="{}"'.format(name), False)
+        return "\n".join(lines) + "\n"
+
+    def _summary(self, lines, metric, histogram, labels="", header=True):
+        if header:
+            lines.append("# TYPE {} summary".format(metric))
+        for q in histogram.quantiles:
+            value = histogram.percentile(q)
+            quantile = 'quantile="{:g}"'.format(q)
+            lines.append("{}{{{}}} {}".format(metric, ",".join(x for x in (labels, quantile) if x), "NaN" if value is None else value))
+        suffix = "{{{}}}".format(labels) if labels else ""
+        lines.append("{}_sum{} {}".format(metric, suffix, histogram.sum))
+        lines.append("{}_count{} {}".format(metric, suffix, histogram.count))
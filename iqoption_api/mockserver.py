@@ -0,0 +1,287 @@
+"""Local stand-in of the IQ Option HTTP and websocket api for benchmarks and offline development, needs aiohttp.
+
+        with MockServer(symbols=20, quote_rate=10) as server:
+            api = IQOption("mail@email.com", "password", host=server.address, secure=False)
+            api.login()
+"""
+
+import asyncio
+import itertools
+import logging
+import random
+import threading
+import time
+import uuid
+from aiohttp import web
+from . import fastjson
+from .replay import fill_order, close_position
+
+FOREX = ["EURUSD", "GBPUSD", "USDJPY", "AUDUSD", "USDCAD", "USDCHF", "NZDUSD", "EURGBP", "EURJPY", "GBPJPY"]
+LEVERAGES = [1, 5, 10, 20, 50, 100, 200, 500]
+
+
+class Account():
+    """Balances and positions of one logged in user"""
+
+    def __init__(self, email, ssid, account_id):
+        self.email = email
+        self.ssid = ssid
+        self.balances = [
+            {"id": account_id * 10 + 1, "type": 1, "amount": 0},
+            {"id": account_id * 10 + 4, "type": 4, "amount": 10000 * 1000000},
+        ]
+        self.balance_type = 4
+        self.positions = {}
+        # limit/stop orders waiting, they are never executed by the mock
+        self.orders = {}
+
+    def profile(self):
+        active = self.balances[0] if self.balance_type == 1 else self.balances[1]
+        return {
+            "isSuccessful": True,
+            "result": {
+                "email": self.email, "currency": "USD", "balances": self.balances,
+                "balance_type": self.balance_type, "balance_id": active["id"], "balance": active["amount"] / 1000000,
+            },
+        }
+
+
+class MockServer():
+    """Serves login/getprofile/changebalance and the websocket protocol of the api on a background thread.
+
+    Every user/password is accepted. The forex instruments are the first
+    `symbols` of FOREX followed by generated ones, subscribed markets get
+    `quote_rate` random walk quotes per second. Market orders fill at the
+    current quote after `fill_delay` seconds, limit/stop orders stay open until
+    canceled.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, symbols=20, quote_rate=10, heartbeat_interval=5, fill_delay=0):
+        self.host = host
+        self.port = port
+        self.quote_rate = quote_rate
+        self.heartbeat_interval = heartbeat_interval
+        self.fill_delay = fill_delay
+        self.logger = logging.getLogger("iqoption_api.mockserver")
+        names = FOREX[:symbols] + ["SYM{:03d}".format(k) for k in range(max(0, symbols - len(FOREX)))]
+        self.instruments = dict((name, active_id) for active_id, name in enumerate(names, 1))
+        self.prices = dict((active_id, 1.0 + random.random()) for active_id in self.instruments.values())
+        self.accounts = {}
+        self.frames_sent = 0
+        self._last_account = None
+        self._account_ids = itertools.count(1)
+        self._order_ids = itertools.count(1)
+        self._position_ids = itertools.count(1)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._started = threading.Event()
+
+    @property
+    def address(self):
+        """`host:port` to pass as `IQOption(..., host=server.address, secure=False)`"""
+        return "{}:{}".format(self.host, self.port)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="iqoption-mockserver")
+        self._thread.daemon = True
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        if self._loop is not None:
+            asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/api/login", self.login)
+        app.router.add_get("/api/getprofile", self.getprofile)
+        app.router.add_post("/api/profile/changebalance", self.changebalance)
+        app.router.add_get("/echo/websocket", self.websocket)
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, self.host, self.port)
+        self._loop.run_until_complete(site.start())
+        self.port = self._runner.addresses[0][1]
+        self._started.set()
+        self._loop.run_forever()
+
+    def _account(self, request):
+        # aiohttp clients do not send cookies to ip addresses, fall back to the latest login
+        return self.accounts.get(request.cookies.get("ssid"), self._last_account)
+
+    async def login(self, request):
+        data = await request.post()
+        ssid = uuid.uuid4().hex
+        account = Account(data.get("email"), ssid, next(self._account_ids))
+        self.accounts[ssid] = self._last_account = account
+        response = web.json_response(account.profile())
+        response.set_cookie("ssid", ssid)
+        return response
+
+    async def getprofile(self, request):
+        return web.json_response(self._account(request).profile())
+
+    async def changebalance(self, request):
+        data = await request.post()
+        account = self._account(request)
+        for balance in account.balances:
+            if str(balance["id"]) == data.get("balance_id"):
+                account.balance_type = balance["type"]
+        return web.json_response({"isSuccessful": True})
+
+    async def websocket(self, request):
+        socket = web.WebSocketResponse()
+        await socket.prepare(request)
+        connection = Connection(self, socket)
+        tasks = [self._loop.create_task(connection.heartbeats()), self._loop.create_task(connection.quotes())]
+        try:
+            async for frame in socket:
+                if frame.type == web.WSMsgType.TEXT:
+                    await connection.handle(fastjson.loads(frame.data))
+        finally:
+            for task in tasks:
+                task.cancel()
+        return socket
+
+
+class Connection():
+    """Websocket session of one client"""
+
+    def __init__(self, server, socket):
+        self.server = server
+        self.socket = socket
+        self.account = None
+        self.subscriptions = set()
+
+    async def send(self, name, msg, request_id=None):
+        data = {"name": name, "msg": msg}
+        if request_id is not None:
+            data["request_id"] = request_id
+        if not self.socket.closed:
+            self.server.frames_sent += 1
+            await self.socket.send_str(fastjson.dumps(data))
+
+    async def heartbeats(self):
+        while True:
+            await self.send("timeSync", int(time.time() * 1000))
+            await self.send("heartbeat", int(time.time() * 1000))
+            await asyncio.sleep(self.server.heartbeat_interval)
+
+    async def quotes(self):
+        server = self.server
+        interval = 1.0 / server.quote_rate
+        started = time.time()
+        sent = 0
+        symbols = dict((active_id, name) for name, active_id in server.instruments.items())
+        while True:
+            due = int((time.time() - started) / interval)
+            # catch up in bursts when sleep granularity is coarser than the quote interval
+            while sent < due:
+                sent += 1
+                for active_id in list(self.subscriptions):
+                    await self.send("newChartData", self.quote(active_id, symbols[active_id]))
+            await asyncio.sleep(max(0.001, interval))
+
+    def quote(self, active_id, symbol):
+        price = self.server.prices[active_id] = self.server.prices[active_id] * (1 + random.gauss(0, 0.0001))
+        spread = price * 0.0001
+        return {
+            "active_id": active_id, "symbol": symbol, "bid": price - spread, "ask": price + spread,
+            "value": price, "volume": 0, "time": time.time(),
+        }
+
+    async def handle(self, data):
+        name = data["name"]
+        if name == "ssid":
+            self.account = self.server.accounts.get(data["msg"], self.server._last_account)
+            await self.send("timeSync", int(time.time() * 1000))
+        elif name in ("subscribeMessage", "unsubscribeMessage"):
+            active_id = data["msg"]["params"]["routingFilters"]["active_id"]
+            if name == "subscribeMessage" and active_id in self.server.prices:
+                self.subscriptions.add(active_id)
+            else:
+                self.subscriptions.discard(active_id)
+        elif name == "sendMessage":
+            request_id = data.get("request_id")
+            handler = getattr(self, "on_" + data["msg"]["name"].replace("-", "_"), None)
+            if handler is not None:
+                await handler(data["msg"].get("body", {}), request_id)
+            else:
+                await self.send("result", {"success": True}, request_id)
+
+    async def on_get_instruments(self, body, request_id):
+        instruments = self.server.instruments if body["type"] == "forex" else {}
+        await self.send("instruments", {"type": body["type"], "instruments": [{"id": name, "active_id": active_id} for name, active_id in instruments.items()]}, request_id)
+
+    async def on_get_top_assets(self, body, request_id):
+        active_ids = list(self.server.instruments.values()) if body["instrument_type"] == "forex" else []
+        await self.send("top-assets", {"instrument_type": body["instrument_type"], "data": [{"active_id": active_id} for active_id in active_ids]}, request_id)
+
+    async def on_get_available_leverages(self, body, request_id):
+        leverages = [{"active_id": active_id, "regulated": LEVERAGES} for active_id in fastjson.loads(body["actives"])]
+        await self.send("available-leverages", {"instrument_type": body["instrument_type"], "leverages": leverages}, request_id)
+
+    async def on_get_positions(self, body, request_id):
+        positions = [p for p in self.account.positions.values() if p["instrument_type"] == body["instrument_type"]]
+        await self.send("positions", {"total": len(positions), "positions": positions}, request_id)
+
+    async def on_place_order_temp(self, body, request_id):
+        server = self.server
+        active_id = server.instruments.get(body["instrument_id"])
+        if active_id is None:
+            await self.send("result", {"success": False, "message": "unknown instrument"}, request_id)
+            return
+        order_id = next(server._order_ids)
+        await self.send("order-placed-temp", {"id": order_id}, request_id)
+        if body["type"] != "market":
+            order, position = fill_order(order_id, next(server._position_ids), body, 1.0, int(time.time() * 1000))
+            order.update({"status": "new", "execute_status": "new", "execute_at": None, "avg_price": None, "avg_price_enrolled": None})
+            self.account.orders[order_id] = order
+            await self.send("order-changed", order)
+            return
+        if server.fill_delay:
+            await asyncio.sleep(server.fill_delay)
+        quote = self.quote(active_id, body["instrument_id"])
+        price = quote["ask"] if body["side"] == "buy" else quote["bid"]
+        order, position = fill_order(order_id, next(server._position_ids), body, price, int(time.time() * 1000))
+        self.account.positions[position["id"]] = position
+        await self.send("position-changed", position)
+        await self.send("order-changed", order)
+
+    async def on_close_position(self, body, request_id):
+        position = self.account.positions.get(body["position_id"])
+        if position is None or position["status"] != "open":
+            await self.send("result", {"success": False, "message": "position is not open"}, request_id)
+            return
+        await self.send("result", {"success": True}, request_id)
+        active_id = self.server.instruments[position["instrument_id"]]
+        quote = self.quote(active_id, position["instrument_id"])
+        price = quote["bid"] if position["buy_avg_price_enrolled"] != 0.0 else quote["ask"]
+        closed = self.account.positions[position["id"]] = close_position(position, price, int(time.time() * 1000))
+        await self.send("position-changed", closed)
+
+    async def on_cancel_order(self, body, request_id):
+        order = self.account.orders.pop(body["order_id"], None)
+        if order is None:
+            await self.send("result", {"success": False, "message": "order is not pending"}, request_id)
+            return
+        await self.send("result", {"success": True}, request_id)
+        order.update({"status": "canceled", "execute_status": "canceled", "update_at": int(time.time() * 1000)})
+        await self.send("order-changed", order)
+
+    async def on_change_tpsl(self, body, request_id):
+        await self.send("result", {"success": True}, request_id)
+        await self.send("tpsl-changed", {"body": body})
@@ -0,0 +1,146 @@
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from .pending import PendingRequests, RequestError
+
+SIDES = frozenset(["buy", "sell"])
+ORDER_TYPES = frozenset(["market", "limit", "stop"])
+
+
+class OrderError(RequestError):
+    """An order was invalid, rejected or canceled"""
+
+
+def failed_future(error):
+    future = Future()
+    future.set_exception(error)
+    return future
+
+
+class OrderTracker():
+    """Futures of orders, closes and cancellations resolved by order-changed and position-changed messages.
+
+    * open: the order-changed of the order, for market orders once it is filled,
+      for limit/stop orders as soon as the server accepted it
+    * close: the position-changed closing the position
+    * cancel: the order-changed canceling the order
+
+    Rejected or unexpectedly canceled orders fail with OrderError, events
+    missing for `timeout` seconds with RequestTimeout. The last state of orders
+    nobody waits for yet (e.g. seen before the place-order-temp reply) is kept
+    for the `keep_recent` most recent orders.
+    """
+
+    def __init__(self, timeout=30, keep_recent=1000):
+        self.keep_recent = keep_recent
+        self.pending = PendingRequests(timeout)
+        self._recent = OrderedDict()
+        self._lock = threading.Lock()
+
+    def track_open(self, request, order_type):
+        """Future of the order placed by the place-order-temp `request` future"""
+
+        future = Future()
+        future.order_id = None
+
+        def placed(request):
+            error = request.exception()
+            if error is not None:
+                future.set_exception(OrderError(error))
+                return
+            try:
+                future.order_id = request.result()["id"]
+            except (KeyError, TypeError):
+                future.set_exception(OrderError("reply without order id: {}".format(request.result())))
+                return
+            self._watch(("open", future.order_id), future, order_type)
+
+        request.add_done_callback(placed)
+        return future
+
+    def expect_close(self, position_id):
+        """Future of the position-changed closing `position_id`, call before sending close-position"""
+        return self._watch(("close", position_id), Future())
+
+    def expect_cancel(self, order_id):
+        """Future of the order-changed canceling `order_id`, call before sending cancel-order"""
+        return self._watch(("cancel", order_id), Future())
+
+    def attach(self, request, future):
+        """Fail `future` if its close/cancel `request` is rejected"""
+
+        def done(request):
+            if request.exception() is not None:
+                self.pending.fail(future.key, OrderError(request.exception()))
+        request.add_done_callback(done)
+
+    def _watch(self, key, future, order_type=None):
+        future.key = key
+        with self._lock:
+            watch = self.pending.register(key, key[0])
+            watch.order_type = order_type
+            recent = self._recent.pop(key[1], None) if key[0] != "close" else None
+        watch.add_done_callback(lambda watch: self._copy(watch, future))
+        if recent is not None:
+            self.on_order_changed(recent)
+        return future
+
+    @staticmethod
+    def _copy(watch, future):
+        if future.done():
+            return
+        if watch.exception() is not None:
+            future.set_exception(watch.exception())
+        else:
+            future.set_result(watch.result())
+
+    def on_order_changed(self, order):
+        order_id = order["id"]
+        status = order["status"]
+        with self._lock:
+            # looked up and stored under the lock _watch registers under, so an
+            # order-changed racing the registration is either matched or kept
+            opening = self.pending.get(("open", order_id))
+            canceling = ("cancel", order_id) in self.pending
+            if opening is None and not canceling:
+                self._recent[order_id] = order
+                self._recent.move_to_end(order_id)
+                while len(self._recent) > self.keep_recent:
+                    self._recent.popitem(last=False)
+        if opening is not None:
+            if status in ("rejected", "canceled"):
+                self.pending.fail(("open", order_id), OrderError(order))
+            elif status == "filled" or opening.order_type != "market":
+                self.pending.resolve(("open", order_id), order)
+        if canceling:
+            if status == "canceled":
+                self.pending.resolve(("cancel", order_id), order)
+            elif status in ("filled", "rejected"):
+                self.pending.fail(("cancel", order_id), OrderError(order))
+
+    def on_position_changed(self, position):
+        if not position.is_open() and ("close", position.id) in self.pending:
+            self.pending.resolve(("close", position.id), position)
+
+    def expire(self):
+        self.pending.expire()
+
+
+def check_order(spec, instrument_cache):
+    """Reason why the order `spec` is invalid or None"""
+
+    for key in ("instrument_id", "side", "amount", "leverage"):
+        if key not in spec:
+            return "missing {}".format(key)
+    if spec["side"] not in SIDES:
+        return "invalid side {}".format(spec["side"])
+    order_type = spec.get("type", "market")
+    if order_type not in ORDER_TYPES:
+        return "invalid order type {}".format(order_type)
+    if order_type == "limit" and not spec.get("limit_price"):
+        return "limit order without limit_price"
+    if order_type == "stop" and not spec.get("stop_price"):
+        return "stop order without stop_price"
+    if not spec["amount"] > 0:
+        return "invalid amount {}".format(spec["amount"])
+    return instrument_cache.check_order(spec.get("instrument_type", "forex"), spec["instrument_id"], spec["leverage"])
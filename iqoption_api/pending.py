@@ -0,0 +1,105 @@
+import itertools
+import threading
+import time
+from concurrent.futures import Future
+
+
+class RequestError(Exception):
+    """The server rejected a request"""
+
+
+class RequestTimeout(RequestError):
+    """No reply arrived within the request timeout"""
+
+
+class PendingRequests():
+    """Requests sent with a `request_id` that still wait for their reply.
+
+    Every request gets a `concurrent.futures.Future` which is resolved with the
+    `msg` of the first reply carrying the same `request_id`. The future also
+    carries `request_id`, `name`, `sent_at` and, once resolved, `latency` (seconds).
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self._prefix = int(time.time())
+        self._ids = itertools.count(1)
+        self._pending = {}
+        self._next_deadline = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._pending)
+
+    def __contains__(self, request_id):
+        return request_id in self._pending
+
+    def new_id(self):
+        return "{}_{}".format(self._prefix, next(self._ids))
+
+    def get(self, request_id):
+        entry = self._pending.get(request_id)
+        return entry[0] if entry is not None else None
+
+    def register(self, request_id, name, timeout=None, callback=None, ack=False):
+        """Track `request_id`, returns the future of its reply.
+
+        With `ack` a successful `result` acknowledgement already resolves the future.
+        """
+
+        future = Future()
+        future.request_id = request_id
+        future.name = name
+        future.ack = ack
+        future.sent_at = time.time()
+        future.latency = None
+        deadline = future.sent_at + (self.timeout if timeout is None else timeout)
+        with self._lock:
+            self._pending[request_id] = (future, deadline)
+            if self._next_deadline is None or deadline < self._next_deadline:
+                self._next_deadline = deadline
+        if callback is not None:
+            future.add_done_callback(callback)
+        return future
+
+    def _pop(self, request_id):
+        with self._lock:
+            entry = self._pending.pop(request_id, None)
+        if entry is None:
+            return None
+        future = entry[0]
+        future.latency = time.time() - future.sent_at
+        return future
+
+    def resolve(self, request_id, message):
+        future = self._pop(request_id)
+        if future is not None:
+            future.set_result(message)
+        return future
+
+    def fail(self, request_id, error):
+        future = self._pop(request_id)
+        if future is not None:
+            future.set_exception(error)
+        return future
+
+    def expire(self, now=None):
+        """Fail every request past its deadline, cheap if nothing is due"""
+
+        now = time.time() if now is None else now
+        if self._next_deadline is None or now < self._next_deadline:
+            return
+        with self._lock:
+            expired = [request_id for request_id, (_, deadline) in self._pending.items() if deadline <= now]
+            deadlines = [deadline for request_id, (_, deadline) in self._pending.items() if deadline > now]
+            self._next_deadline = min(deadlines) if deadlines else None
+        for request_id in expired:
+            self.fail(request_id, RequestTimeout("no reply to request {}".format(request_id)))
+
+    def cancel_all(self, error):
+        """Fail every pending request, e.g. when the connection is lost"""
+
+        with self._lock:
+            request_ids = list(self._pending)
+        for request_id in request_ids:
+            self.fail(request_id, error)
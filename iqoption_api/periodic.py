@@ -0,0 +1,39 @@
+import threading
+
+
+class Periodic():
+    """Calls `function` every `interval` seconds on a daemon thread named `name`.
+
+    Exceptions of `function` are logged to `logger` and do not stop the thread.
+    """
+
+    def __init__(self, function, interval, name, logger):
+        self.function = function
+        self.interval = interval
+        self.name = name
+        self.logger = logger
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopped.clear()
+        self._thread = threading.Thread(target=self._run, name=self.name)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread and wait for a running call to finish"""
+
+        if self._thread is not None:
+            self._stopped.set()
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            try:
+                self.function()
+            except Exception:
+                self.logger.exception("error in {}".format(self.name))
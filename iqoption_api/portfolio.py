@@ -0,0 +1,55 @@
+import numpy
+from .position import round_sig
+
+
+def evaluate_positions(positions, bid, ask, percent_buffer=None, sig=8):
+    """Current win, stop loss and take profit of many positions in one pass.
+
+    `bid` and `ask` are the latest quotes aligned with `positions`. Returns a
+    dict of arrays aligned with `positions`:
+
+    * `id`, `current_win`, `stop_loss_percent`
+    * `stoploss` and `takeprofit` (only with `percent_buffer`), rounded to `sig` significant digits
+
+    The arithmetic mirrors Position.get_current_win, stop_loss_percent,
+    get_stoploss and get_takeprofit operation by operation, so the results are
+    identical to the scalar methods. Positions that are neither buy nor sell get
+    a current win of 0.0 and NaN for everything else, a NaN quote (no quote yet)
+    gives NaN results and never a zero price, as does a leverage of 0.
+    """
+
+    bid = numpy.asarray(bid, dtype=numpy.float64)
+    ask = numpy.asarray(ask, dtype=numpy.float64)
+    buy_price = numpy.array([pos.buy_avg_price_enrolled for pos in positions], dtype=numpy.float64)
+    sell_price = numpy.array([pos.sell_avg_price_enrolled for pos in positions], dtype=numpy.float64)
+    leverage = numpy.array([pos.leverage for pos in positions], dtype=numpy.float64)
+    is_sell = buy_price == 0.0
+    is_buy = ~is_sell & (sell_price == 0.0)
+    unknown = ~is_sell & ~is_buy
+    open_price = numpy.where(is_sell, sell_price, buy_price)
+    stop_price = numpy.array([pos.stop_loss() for pos in positions], dtype=numpy.float64)
+
+    result = {"id": numpy.array([pos.id for pos in positions])}
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        current_win = numpy.where(is_sell, (1 - ask / sell_price) * leverage, (1 - buy_price / bid) * leverage)
+        current_win[unknown] = 0.0
+        result["current_win"] = current_win
+        stop_loss_percent = numpy.where(is_sell, (1 - stop_price / sell_price) * leverage * 100, (-1 + stop_price / buy_price) * leverage * 100)
+        stop_loss_percent[unknown] = numpy.nan
+        result["stop_loss_percent"] = stop_loss_percent
+        if percent_buffer is not None:
+            offset = percent_buffer * open_price / leverage
+            ratio = open_price / bid
+            buffer = percent_buffer / leverage
+            # the scalar methods raise ZeroDivisionError without leverage, never return a price there
+            no_price = unknown | (leverage == 0)
+            result["stoploss"] = _round_sig(numpy.where(is_sell, ask + offset, open_price / (ratio + buffer)), no_price, sig)
+            result["takeprofit"] = _round_sig(numpy.where(is_sell, ask - offset, open_price / (ratio - buffer)), no_price, sig)
+    return result
+
+
+def _round_sig(values, unknown, sig):
+    # numpy.round is not correctly rounded, use the scalar implementation to match Position.round_sig exactly
+    rounded = numpy.array([round_sig(x, sig) for x in values.tolist()], dtype=numpy.float64)
+    rounded[unknown] = numpy.nan
+    return rounded
@@ -1,35 +1,79 @@
 import logging
 import time
-from math import log10, floor
+from math import log10, floor, isfinite
 import datetime
 
 
-class Position():
+def round_sig(x, sig=8):
+    """Round `x` to `sig` significant digits, NaN for missing quotes or infinite values"""
+    if not isfinite(x):
+        return float("nan")
+    try:
+        return round(x, sig-int(floor(log10(abs(x))))-1)
+    except ValueError:
+        return 0
+
+
+class Position(object):
+    """An open or closed position, updated in place from position-changed messages.
+
+    The fields the api works with are slots, any other field the server sends
+    is kept in `_extra` and is still readable as attribute.
+    """
+
+    fields = (
+        "id", "status", "instrument_type", "instrument_id", "instrument_active_id",
+        "user_balance_id", "leverage", "count", "margin", "currency",
+        "buy_avg_price", "buy_avg_price_enrolled", "sell_avg_price", "sell_avg_price_enrolled",
+        "pnl", "pnl_realized", "create_at", "update_at", "close_at", "close_reason",
+        "extra_data", "orders",
+    )
+    __slots__ = fields + (
+        "min_watermark", "max_watermark", "current_watermark",
+        "stop_lose_order_id", "take_profit_order_id", "_extra", "_order_index", "_watermark_listener",
+    )
+    _fields = frozenset(fields)
+    logger = logging.getLogger("iqoption_api.position")
+    close_logger = logging.getLogger("iqoption_api.position.close")
+
     def __init__(self, data):
         self.min_watermark = 100
         self.max_watermark = -95
         self.current_watermark = -95
+        self.orders = []
+        self._order_index = {}
+        self._extra = {}
+        self._watermark_listener = None
         self.__parse_data(data)
 
+    def __getattr__(self, name):
+        # only called for unset slots and fields outside of the slots, private
+        # names are never server fields and `_extra` is unset while copy/pickle restore the slots
+        if name.startswith("_"):
+            raise AttributeError(name)
+        try:
+            return self._extra[name]
+        except KeyError:
+            raise AttributeError(name)
+
     def __parse_data(self, data):
         """
-        Parse data from API. Unchanged fields will have a None value, so let's filter them out first.
+        Parse data from API. Unchanged fields will have a None value, so only the other fields are merged.
+        An empty orders list keeps the known orders.
         """
-        data = {k: v for k, v in data.items() if v is not None}
-        prevmin = self.min_watermark
-        prevmax = self.max_watermark
-        prevcurrent = self.current_watermark
-        orders = None
-        if (("orders" in data and len(data["orders"]) == 0)) and ("orders" not in data and hasattr(self, 'orders')):
-            orders = self.orders
-
-        self.__dict__ = data
-        self.max_watermark = prevmax
-        self.min_watermark = prevmin
-        self.current_watermark = prevcurrent
-        if orders:
-            self.orders = orders
-        self.logger = logging.getLogger("iqoption_api.position")
+        fields = self._fields
+        extra = self._extra
+        for k, v in data.items():
+            if v is None:
+                continue
+            if k in fields:
+                if k == "orders":
+                    if not v:
+                        continue
+                    self._order_index = dict((order["id"], index) for index, order in enumerate(v))
+                object.__setattr__(self, k, v)
+            else:
+                extra[k] = v
 
     def to_date(self, timestamp):
         return datetime.datetime.fromtimestamp(
@@ -40,31 +84,39 @@ class Position():
         prev = self.is_open()
         self.__parse_data(data)
         if self.is_open() != prev:
-            logger = logging.getLogger("iqoption_api.position.close")
             self.logger.info("posisiton closed")
-            logger.info('{},{},{},{:0.3f},{:0.3f},{:0.3f},{},{},{}'.format(self.to_date(self.close_at), self.to_date(self.create_at), self.id, self.min_watermark, self.current_watermark, self.max_watermark, self.close_reason, self.instrument_id, self.leverage))
+            self.close_logger.info('{},{},{},{:0.3f},{:0.3f},{:0.3f},{},{},{}'.format(self.to_date(self.close_at), self.to_date(self.create_at), self.id, self.min_watermark, self.current_watermark, self.max_watermark, self.close_reason, self.instrument_id, self.leverage))
 
     def update_watermarks(self, percent):
         self.min_watermark = min(self.min_watermark, percent)
         self.max_watermark = max(self.max_watermark, percent)
         self.current_watermark = percent
+        if self._watermark_listener is not None:
+            self._watermark_listener(self)
+
+    def set_watermark_listener(self, listener):
+        """Call `listener(position)` after every update_watermarks"""
+        self._watermark_listener = listener
 
     def update_order(self, data):
         """{'instrument_id_escape': 'USDNOK', 'basic_stoplimit_amount': 68.0, 'take_profit_price': None, 'stop_lose_price': None, 'tpsl_extra': None, 'instrument_strike_value': None, 'instrument_type': 'forex', 'instrument_id': 'USDNOK', 'instrument_underlying': 'USDNOK', 'instrument_active_id': 168, 'instrument_expiration': None, 'instrument_strike': None, 'instrument_dir': None, 'id': 197997486, 'user_id': 25309108, 'user_balance_id': 43902542, 'user_balance_type': 4, 'position_id': 105120553, 'create_at': 1512136901477, 'update_at': 1512136902059, 'execute_at': 1512136902080, 'side': 'sell', 'type': 'market', 'status': 'filled', 'execute_status': 'trade', 'count': 410.19, 'leverage': 50, 'underlying_price': 8.28878, 'avg_price': 8.28878, 'avg_price_enrolled': 8.28878, 'client_platform_id': 9, 'limit_price': 0.0, 'stop_price': 0.0, 'currency': 'USD', 'margin': 67.999493, 'spread': 0.002149999999998542, 'commission_amount': 0.0, 'commission_amount_enrolled': 0.0, 'extra_data': {'amount': 68000000, 'auto_margin_call': False, 'paid_for_commission': 3.2978681700337323e-229, 'use_token_for_commission': False, 'paid_for_commission_enrolled': 3.2978681700337323e-229}, 'time_in_force': 'good_till_cancel', 'time_in_force_date': None, 'index': 268787403}"""
         order_id = data["id"]
-        saved = False
-        for k, order in enumerate(self.orders):
-            if order['id'] == order_id:
-                self.orders[k] = data
-                saved = True
-        if not saved:
+        index = self._order_index.get(order_id)
+        if index is not None:
+            self.orders[index] = data
+        else:
+            self._order_index[order_id] = len(self.orders)
             self.orders.append(data)
-        self.logger.debug(self.orders)
+        debug = self.logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            self.logger.debug("orders of position {}: {}".format(self.id, self.orders))
         if data["type"] == "stop" and data["status"] != "canceled":
-            self.logger.debug("updated stop_lose_order_id to {} of position {}".format(order_id, self.id))
+            if debug:
+                self.logger.debug("updated stop_lose_order_id to {} of position {}".format(order_id, self.id))
             self.stop_lose_order_id = order_id
         if data["type"] == "limit" and data["status"] != "canceled":
-            self.logger.debug("updated take_profit_order_id to {}  of position {}".format(order_id, self.id))
+            if debug:
+                self.logger.debug("updated take_profit_order_id to {}  of position {}".format(order_id, self.id))
             self.take_profit_order_id = order_id
         # else:
         #     self.logger.info("got order update type: {}".format(data["type"]))
@@ -73,10 +125,14 @@ class Position():
         pass
 
     def get_data(self):
-        return self.__dict__
+        data = dict(self._extra)
+        for k in self.__slots__:
+            if not k.startswith("_") and hasattr(self, k):
+                data[k] = getattr(self, k)
+        return data
 
     def is_open(self):
-        return self.__dict__["status"] == "open"
+        return self.status == "open"
 
     def is_sell(self):
         return self.buy_avg_price_enrolled == 0.0
@@ -84,11 +140,17 @@ class Position():
     def is_buy(self):
         return self.sell_avg_price_enrolled == 0.0
 
+    def get_order(self, order_id):
+        """Order of this position by id or None"""
+        index = self._order_index.get(order_id)
+        return None if index is None else self.orders[index]
+
     def stop_loss(self):
         try:
-            return [order["stop_price"] for order in self.orders if order["id"] == self.stop_lose_order_id][0]
-        except (IndexError, AttributeError):
-            self.logger.debug("found no stop order, calculation of posistion loss for {}".format(self.id))
+            return self.get_order(self.stop_lose_order_id)["stop_price"]
+        except (TypeError, AttributeError):
+            if self.logger.isEnabledFor(logging.DEBUG):
+                self.logger.debug("found no stop order, calculation of posistion loss for {}".format(self.id))
             if self.is_sell():
                 return (1 + 0.95/self.leverage) * self.sell_avg_price_enrolled
             else:
@@ -129,10 +191,7 @@ class Position():
             raise ValueError("unknown")
 
     def round_sig(self, x, sig=8):
-        try:
-            return round(x, sig-int(floor(log10(abs(x))))-1)
-        except ValueError:
-            return 0
+        return round_sig(x, sig)
 
     def get_takeprofit(self, percent_buffer, last_market_data):
         if self.is_sell():
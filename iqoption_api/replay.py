@@ -0,0 +1,211 @@
+"""Recording of raw socket frames and their replay through an IQOption without network"""
+
+import gzip
+import itertools
+import logging
+import struct
+import threading
+import time
+from . import fastjson
+
+MAGIC = b"IQREC\x01"
+# receive time (seconds since the epoch) and length of the utf-8 frame following it
+RECORD = struct.Struct("<dI")
+
+
+class FrameRecorder():
+    """Writes raw frames with their receive time to a gzip compressed file.
+
+    The file starts with `MAGIC`, every frame is a `RECORD` header followed by
+    the frame. A frame cut off by a crash is ignored by read_frames.
+    """
+
+    def __init__(self, path, compresslevel=6):
+        self.path = path
+        self.frames = 0
+        self._file = gzip.open(path, "wb", compresslevel)
+        self._file.write(MAGIC)
+        self._lock = threading.Lock()
+
+    def record(self, frame, received_at=None):
+        data = frame.encode("utf-8") if not isinstance(frame, bytes) else frame
+        received_at = time.time() if received_at is None else received_at
+        with self._lock:
+            if self._file is not None:
+                self._file.write(RECORD.pack(received_at, len(data)) + data)
+                self.frames += 1
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def read_frames(path):
+    """Yield `(received_at, frame)` of a file written by FrameRecorder"""
+
+    with gzip.open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not a frame recording".format(path))
+        while True:
+            header = f.read(RECORD.size)
+            if len(header) < RECORD.size:
+                return
+            received_at, size = RECORD.unpack(header)
+            data = f.read(size)
+            if len(data) < size:
+                return
+            yield received_at, data.decode("utf-8")
+
+
+def fill_order(order_id, position_id, body, price, now):
+    """order-changed and position-changed messages of a place-order-temp `body` filled at `price` at `now` (ms)"""
+
+    buy = body["side"] == "buy"
+    amount = body["amount"]
+    leverage = body["leverage"]
+    order = {
+        "id": order_id, "position_id": position_id, "user_balance_id": body["user_balance_id"],
+        "instrument_type": body["instrument_type"], "instrument_id": body["instrument_id"],
+        "side": body["side"], "type": body["type"], "status": "filled", "execute_status": "trade",
+        "create_at": now, "update_at": now, "execute_at": now, "count": amount * leverage / price,
+        "leverage": leverage, "avg_price": price, "avg_price_enrolled": price,
+        "limit_price": body.get("limit_price"), "stop_price": body.get("stop_price"), "margin": amount,
+    }
+    position = {
+        "id": position_id, "status": "open", "instrument_type": body["instrument_type"],
+        "instrument_id": body["instrument_id"], "user_balance_id": body["user_balance_id"],
+        "leverage": leverage, "count": order["count"], "margin": amount,
+        "buy_avg_price": price if buy else 0.0, "buy_avg_price_enrolled": price if buy else 0.0,
+        "sell_avg_price": 0.0 if buy else price, "sell_avg_price_enrolled": 0.0 if buy else price,
+        "pnl": 0.0, "pnl_realized": 0.0, "create_at": now, "update_at": now, "close_at": None,
+        "close_reason": None, "extra_data": {"amount": amount * 1000000}, "orders": [order],
+    }
+    return order, position
+
+
+def close_position(position, price, now):
+    """position-changed message closing the `position` message at `price` at `now` (ms)"""
+
+    closed = dict(position)
+    buy = position["buy_avg_price_enrolled"] != 0.0
+    opened = position["buy_avg_price_enrolled"] if buy else position["sell_avg_price_enrolled"]
+    change = price / opened - 1 if buy else 1 - price / opened
+    closed.update({
+        "status": "closed", "close_at": now, "update_at": now, "close_reason": "default",
+        "pnl_realized": position["margin"] * position["leverage"] * change,
+    })
+    return closed
+
+
+class FillSimulator():
+    """Answers the requests of an IQOption in place of the server.
+
+    Installed as `api.send_raw`. place-order-temp is filled at the latest quote
+    of the instrument (ask for buys, bid for sells) and answered with
+    order-placed-temp, position-changed and order-changed messages, close-position
+    closes at the latest quote. Every other request gets a successful `result`.
+    Fills are collected in `fills`.
+    """
+
+    def __init__(self, api):
+        self.api = api
+        self.fills = []
+        self.positions = {}
+        self.logger = logging.getLogger("iqoption_api.replay")
+        self._order_ids = itertools.count(1)
+        self._position_ids = itertools.count(1)
+
+    def install(self):
+        self.api.send_raw = self.send
+
+    def send(self, payload):
+        data = fastjson.loads(payload)
+        if data["name"] != "sendMessage":
+            return
+        request_id = data["request_id"]
+        msg = data["msg"]
+        if msg["name"] == "place-order-temp":
+            self.fill(request_id, msg["body"])
+        elif msg["name"] == "close-position" and msg["body"]["position_id"] in self.positions:
+            self.close(request_id, msg["body"]["position_id"])
+        else:
+            self.reply("result", {"success": True}, request_id)
+
+    def reply(self, name, msg, request_id=None):
+        data = {"name": name, "msg": msg}
+        if request_id is not None:
+            data["request_id"] = request_id
+        self.api.on_socket_message(None, fastjson.dumps(data))
+
+    def fill(self, request_id, body):
+        instrument_id = body["instrument_id"]
+        quote = self.api.last_market_data.get(instrument_id)
+        if quote is None:
+            self.logger.info("no quote of {} to fill an order".format(instrument_id))
+            self.reply("result", {"success": False, "message": "no quote of {}".format(instrument_id)}, request_id)
+            return
+        price = quote["ask"] if body["side"] == "buy" else quote["bid"]
+        order, position = fill_order(next(self._order_ids), next(self._position_ids), body, price, int(quote["time"] * 1000))
+        self.fills.append(order)
+        self.positions[position["id"]] = position
+        self.reply("order-placed-temp", {"id": order["id"]}, request_id)
+        self.reply("position-changed", position)
+        self.reply("order-changed", order)
+
+    def close(self, request_id, position_id):
+        position = self.positions.pop(position_id)
+        quote = self.api.last_market_data[position["instrument_id"]]
+        # a buy position is closed by selling at the bid
+        price = quote["bid"] if position["buy_avg_price_enrolled"] != 0.0 else quote["ask"]
+        self.reply("result", {"success": True}, request_id)
+        self.reply("position-changed", close_position(position, price, int(quote["time"] * 1000)))
+
+
+class Replayer():
+    """Feeds a recording through `api.on_socket_message`, i.e. the same handlers as a live session.
+
+    `speed=1` replays at the recorded pace, `speed=10` ten times faster and
+    `speed=None` as fast as possible. Requests of the api are answered by a
+    FillSimulator (`simulate_fills=False` drops them).
+    """
+
+    def __init__(self, api, path, speed=None, simulate_fills=True):
+        self.api = api
+        self.path = path
+        self.speed = speed
+        self.simulator = FillSimulator(api) if simulate_fills else None
+        if self.simulator is not None:
+            self.simulator.install()
+        else:
+            api.send_raw = lambda payload: None
+        api.connected.set()
+
+    def run(self, limit=None):
+        """Replay the frames (at most `limit`), returns frames, seconds, handler seconds and frames/sec of the handlers"""
+
+        on_socket_message = self.api.on_socket_message
+        frames = 0
+        handler_time = 0.0
+        first = None
+        started = time.time()
+        for received_at, frame in read_frames(self.path):
+            if limit is not None and frames >= limit:
+                break
+            if self.speed:
+                if first is None:
+                    first = received_at
+                delay = started + (received_at - first) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+            begin = time.perf_counter()
+            on_socket_message(None, frame)
+            handler_time += time.perf_counter() - begin
+            frames += 1
+        return {
+            "frames": frames,
+            "seconds": time.time() - started,
+            "handler_seconds": handler_time,
+            "frames_per_second": frames / handler_time if handler_time else 0.0,
+        }
@@ -0,0 +1,152 @@
+import logging
+import threading
+import time
+from .pending import RequestTimeout
+from .periodic import Periodic
+
+
+class TPSLScheduler():
+    """Sends change-tpsl updates within a rate budget and retries unconfirmed ones.
+
+    Only the newest desired stop loss/take profit of a position is kept, values
+    equal to the confirmed or in-flight ones are not sent again. Sends are
+    limited to `rate` per second overall (bursts of `burst`) and one per
+    `position_interval` seconds per position. An update counts as confirmed
+    by a successful reply to its request, a tpsl-changed message or a new
+    stop/limit order of the position; unconfirmed updates are sent again after
+    `confirm_timeout` seconds, at most `max_retries` times.
+
+    `send(position_id, stop_lose, take_profit)` has to return the request future.
+    """
+
+    def __init__(self, send, rate=10, burst=10, position_interval=0.5, confirm_timeout=5, max_retries=3, tick=0.05):
+        self.send = send
+        self.rate = rate
+        self.burst = burst
+        self.position_interval = position_interval
+        self.confirm_timeout = confirm_timeout
+        self.max_retries = max_retries
+        self.tick = tick
+        self.logger = logging.getLogger("iqoption_api.tpsl")
+        self.stats = {"sent": 0, "skipped": 0, "confirmed": 0, "retried": 0, "failed": 0}
+        self._desired = {}
+        self._inflight = {}
+        self._confirmed = {}
+        self._last_sent = {}
+        self._retries = {}
+        self._tokens = burst
+        self._refilled_at = time.time()
+        self._lock = threading.Lock()
+        self._flusher = Periodic(self.flush, tick, "iqoption-tpsl", self.logger)
+
+    def set(self, position_id, stop_lose, take_profit=None):
+        """Request new values for a position, sent as soon as the budget allows"""
+
+        values = (stop_lose, take_profit)
+        with self._lock:
+            inflight = self._inflight.get(position_id)
+            current = inflight[0] if inflight is not None else self._confirmed.get(position_id)
+            if current == values:
+                self._desired.pop(position_id, None)
+                self.stats["skipped"] += 1
+                return
+            self._desired[position_id] = values
+            self._retries.pop(position_id, None)
+        self.flush()
+
+    def confirm(self, position_id, entry=None):
+        """The in-flight update of `position_id` (only if it is still `entry`) was applied by the server"""
+
+        with self._lock:
+            current = self._inflight.get(position_id)
+            if current is not None and (entry is None or current is entry):
+                del self._inflight[position_id]
+                self._confirmed[position_id] = current[0]
+                self._retries.pop(position_id, None)
+                self.stats["confirmed"] += 1
+
+    def forget(self, position_id):
+        with self._lock:
+            for state in (self._desired, self._inflight, self._confirmed, self._last_sent, self._retries):
+                state.pop(position_id, None)
+
+    def pending(self):
+        """Number of updates waiting to be sent or confirmed"""
+        return len(self._desired) + len(self._inflight)
+
+    def flush(self, now=None):
+        """Send what the rate budget allows and requeue timed out updates"""
+
+        now = time.time() if now is None else now
+        sends = []
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            for position_id, entry in list(self._inflight.items()):
+                if now - entry[1] > self.confirm_timeout:
+                    del self._inflight[position_id]
+                    self._retry(position_id, entry[0])
+            for position_id, values in list(self._desired.items()):
+                if self._tokens < 1:
+                    break
+                if now - self._last_sent.get(position_id, 0) < self.position_interval:
+                    continue
+                del self._desired[position_id]
+                entry = [values, now, None]
+                self._inflight[position_id] = entry
+                self._last_sent[position_id] = now
+                self._tokens -= 1
+                sends.append((position_id, entry))
+        for position_id, entry in sends:
+            self._send(position_id, entry)
+
+    def _send(self, position_id, entry):
+        try:
+            future = self.send(position_id, *entry[0])
+        except Exception:
+            self.logger.exception("error sending change-tpsl of {}".format(position_id))
+            with self._lock:
+                if self._inflight.get(position_id) is entry:
+                    del self._inflight[position_id]
+                    self._retry(position_id, entry[0])
+            return
+        self.stats["sent"] += 1
+        entry[2] = future
+        if future is not None:
+            future.add_done_callback(lambda future: self._on_reply(position_id, entry, future))
+
+    def _on_reply(self, position_id, entry, future):
+        error = future.exception()
+        if error is None:
+            self.confirm(position_id, entry)
+            return
+        if isinstance(error, RequestTimeout):
+            # might still be applied, a tpsl-changed message or confirm_timeout decides
+            return
+        with self._lock:
+            if self._inflight.get(position_id) is entry:
+                del self._inflight[position_id]
+                self.logger.info("change-tpsl of {} rejected: {}".format(position_id, error))
+                self._retry(position_id, entry[0])
+
+    def _retry(self, position_id, values):
+        # called with the lock held
+        if position_id in self._desired:
+            # newer values are waiting anyway
+            return
+        retries = self._retries.get(position_id, 0)
+        if retries >= self.max_retries:
+            self.logger.warning("giving up change-tpsl of {} after {} retries".format(position_id, retries))
+            self._retries.pop(position_id, None)
+            self.stats["failed"] += 1
+            return
+        self._retries[position_id] = retries + 1
+        self._desired[position_id] = values
+        self.stats["retried"] += 1
+
+    def start(self):
+        """Flush every `tick` seconds on a daemon thread"""
+        self._flusher.start()
+
+    def stop(self):
+        self._flusher.stop()
@@ -0,0 +1,54 @@
+import logging
+import time
+from logging.handlers import QueueHandler, QueueListener
+from queue import Queue
+from . import fastjson
+
+
+class SampledTracer():
+    """Structured trace of 1 in `every` quotes per symbol and of position updates.
+
+    Every trace is one JSON line logged to a private `iqoption_api.trace` logger
+    of this tracer (not registered with logging, so tracers of several accounts
+    never see each other's traces), which only puts the record on a queue; a
+    QueueListener thread hands it to `handler` (a StreamHandler on stderr by
+    default), so slow log output never delays the socket thread.
+    """
+
+    logger_name = "iqoption_api.trace"
+
+    def __init__(self, every=100, handler=None):
+        self.every = every
+        self.handler = handler if handler is not None else logging.StreamHandler()
+        self.logger = logging.Logger(self.logger_name, logging.INFO)
+        self.logger.propagate = False
+        self._queue = Queue()
+        self._queue_handler = QueueHandler(self._queue)
+        self._listener = QueueListener(self._queue, self.handler)
+        self._counts = {}
+        self._started = False
+
+    def start(self):
+        self.logger.addHandler(self._queue_handler)
+        self._listener.start()
+        self._started = True
+
+    def stop(self):
+        """Write the queued traces and detach from the logger"""
+
+        self.logger.removeHandler(self._queue_handler)
+        if self._started:
+            self._listener.stop()
+            self._started = False
+
+    def quote(self, symbol, message):
+        count = self._counts.get(symbol, 0) + 1
+        self._counts[symbol] = count
+        if count % self.every:
+            return
+        self.event("quote", symbol=symbol, time=message["time"], bid=message["bid"], ask=message["ask"], count=count)
+
+    def event(self, kind, **fields):
+        fields["event"] = kind
+        fields["at"] = time.time()
+        self.logger.info(fastjson.dumps(fields))
@@ -0,0 +1,105 @@
+import logging
+import os
+import struct
+import threading
+from .periodic import Periodic
+
+RECORD = struct.Struct("<qddd")
+NAN = float("nan")
+
+
+class WatermarkStore():
+    """Crash-safe watermark persistence as an append-only log of fixed size records.
+
+    `record` only remembers the newest watermarks of a position in memory, a
+    daemon thread appends the changed ones every `flush_interval` seconds and
+    fsyncs the log. A record is `(position id, min, max, current)`, a record with
+    NaN watermarks forgets the position. When the log holds more than
+    `compact_ratio` times the live records it is rewritten to a temporary file
+    and atomically swapped in. A torn record at the end (crash while writing)
+    is ignored when loading.
+    """
+
+    def __init__(self, path, flush_interval=1.0, compact_ratio=4):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.compact_ratio = compact_ratio
+        self.logger = logging.getLogger("iqoption_api.watermarks")
+        self._live = {}
+        self._dirty = {}
+        self._records = 0
+        self._lock = threading.Lock()
+        self._io_lock = threading.Lock()
+        self._flusher = Periodic(self.flush, flush_interval, "iqoption-watermarks", self.logger)
+
+    def load(self):
+        """Read the log, returns `{position id: {'min', 'max', 'current'}}`"""
+
+        live = {}
+        records = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                data = f.read()
+            usable = len(data) - len(data) % RECORD.size
+            if usable != len(data):
+                self.logger.warning("ignoring torn record at the end of {}".format(self.path))
+            for position_id, low, high, current in RECORD.iter_unpack(data[:usable]):
+                records += 1
+                if low != low:
+                    live.pop(position_id, None)
+                else:
+                    live[position_id] = (low, high, current)
+            if usable != len(data):
+                with open(self.path, "r+b") as f:
+                    f.truncate(usable)
+        self._live = live
+        self._records = records
+        return dict((k, {"min": v[0], "max": v[1], "current": v[2]}) for k, v in live.items())
+
+    def record(self, position):
+        """Remember the watermarks of `position`, written by the next flush"""
+        with self._lock:
+            self._dirty[position.id] = (position.min_watermark, position.max_watermark, position.current_watermark)
+
+    def forget(self, position_id):
+        with self._lock:
+            self._dirty[position_id] = (NAN, NAN, NAN)
+
+    def flush(self):
+        """Append all changed watermarks and fsync, compacts the log if needed"""
+
+        with self._lock:
+            dirty, self._dirty = self._dirty, {}
+        if not dirty:
+            return
+        with self._io_lock:
+            with open(self.path, "ab") as f:
+                f.write(b"".join(RECORD.pack(k, *v) for k, v in dirty.items()))
+                f.flush()
+                os.fsync(f.fileno())
+            self._records += len(dirty)
+            for k, v in dirty.items():
+                if v[0] != v[0]:
+                    self._live.pop(k, None)
+                else:
+                    self._live[k] = v
+            if self._records > self.compact_ratio * max(len(self._live), 16):
+                self._compact()
+
+    def _compact(self):
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(RECORD.pack(k, *v) for k, v in self._live.items()))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self._records = len(self._live)
+
+    def start(self):
+        """Flush every `flush_interval` seconds on a daemon thread"""
+        self._flusher.start()
+
+    def close(self):
+        """Stop the flush thread and write everything pending"""
+        self._flusher.stop()
+        self.flush()
@@ -3,6 +3,7 @@ setup(
     name="iqoption-api",
     version="0.2a",
     packages=find_packages(),
+    python_requires=">=3.4",
     author="Sri Harsha Gangisetty",
     author_email="sriharshagangisetty@gmail.com",
     license="Apache License 2.0",
@@ -0,0 +1,38 @@
+import asyncio
+
+from iqoption_api.aio import AsyncIQOption
+from iqoption_api.watermarks import WatermarkStore
+
+
+def test_close_writes_pending_watermarks(tmp_path):
+    path = str(tmp_path / "watermarks.log")
+
+    async def run():
+        api = AsyncIQOption("mail@email.com", "password", watermark_file=path, watermark_flush_interval=60)
+        position = api.parse_position_message({"id": 5, "status": "open", "instrument_id": "EURUSD", "leverage": 100,
+                                               "buy_avg_price_enrolled": 1.1, "sell_avg_price_enrolled": 0.0})
+        position.update_watermarks(12.5)
+        await api.close()
+
+    asyncio.run(run())
+    assert WatermarkStore(path).load() == {5: {"min": 12.5, "max": 12.5, "current": 12.5}}
+
+
+def test_workers_rejected():
+    try:
+        AsyncIQOption("mail@email.com", "password", workers=2)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("workers accepted")
+
+
+def test_close_delivers_conflated_quotes():
+    async def run():
+        api = AsyncIQOption("mail@email.com", "password")
+        api.conflator.add("EURUSD", {"time": 1.0, "bid": 1.1, "ask": 1.2, "value": 1.15})
+        await api.close()
+        return api
+
+    api = asyncio.run(run())
+    assert api.market_data["EURUSD"].latest()["value"] == 1.15
@@ -0,0 +1,27 @@
+import threading
+
+from iqoption_api.api import IQOption
+
+
+def quote(symbol, time, value):
+    return {"symbol": symbol, "time": time, "bid": value - 0.001, "ask": value + 0.001, "value": value}
+
+
+def test_quotes_from_conflation_and_socket_thread():
+    api = IQOption("mail@email.com", "password", candle_intervals=(1,))
+    symbols = 200
+
+    def store(prefix):
+        for k in range(symbols):
+            symbol = "{}{:03d}".format(prefix, k)
+            api.store_quote(symbol, quote(symbol, 1.0, 1.0 + k))
+
+    threads = [threading.Thread(target=store, args=(prefix,)) for prefix in ("A", "B")]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    snapshot = api.get_market_snapshot()
+    assert len(snapshot["symbol"]) == len(set(snapshot["symbol"])) == 2 * symbols
+    for symbol, value in zip(snapshot["symbol"], snapshot["value"]):
+        assert value == 1.0 + int(symbol[1:])
@@ -0,0 +1,24 @@
+from iqoption_api.book import PositionBook
+
+
+def message(position_id, status):
+    return {"id": position_id, "status": status, "instrument_id": "EURUSD", "leverage": 50,
+            "buy_avg_price_enrolled": 1.1, "sell_avg_price_enrolled": 0.0,
+            "create_at": 1500000000000, "close_at": 1500000001000, "close_reason": "default"}
+
+
+def test_eviction_follows_updates_not_reads():
+    book = PositionBook(keep_closed=2)
+    evicted = []
+    book.on_evict.append(lambda position: evicted.append(position.id))
+    for position_id in (1, 2):
+        book.update(message(position_id, "open"))
+        book.update(message(position_id, "closed"))
+    assert book[1].id == 1
+    book.update(message(3, "closed"))
+    assert evicted == [1] and 1 not in book
+    book.update(message(2, "closed"))
+    book.update(message(4, "closed"))
+    assert evicted == [1, 3]
+    assert book.closed_ids() == {2, 4}
+    assert [p.id for p in book.open_positions()] == []
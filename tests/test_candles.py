@@ -0,0 +1,46 @@
+from iqoption_api.candles import CandleAggregator
+
+
+def quote(time, value, volume=0):
+    return {"time": time, "value": value, "volume": volume}
+
+
+def test_bucket_boundaries_and_bar_close():
+    candles = CandleAggregator((1, 5), capacity=10)
+    closed = []
+    candles.on_bar_close(lambda symbol, interval, candle: closed.append((symbol, interval, candle)))
+    for time, value in ((10.0, 1.0), (10.5, 3.0), (10.9, 0.5), (11.0, 2.0), (14.99, 4.0), (15.0, 5.0)):
+        candles.add("EURUSD", quote(time, value, 1))
+    assert [(interval, c["time"]) for _, interval, c in closed] == [(1, 10.0), (1, 11.0), (1, 14.0), (5, 10.0)]
+    first = closed[0][2]
+    assert (first["open"], first["high"], first["low"], first["close"], first["volume"], first["ticks"]) == (1.0, 3.0, 0.5, 0.5, 3, 3)
+    five = closed[-1][2]
+    assert (five["open"], five["high"], five["low"], five["close"], five["ticks"]) == (1.0, 4.0, 0.5, 4.0, 5)
+    assert candles.current("EURUSD", 5)["time"] == 15.0
+
+
+def test_late_quote_is_ignored():
+    candles = CandleAggregator((1,))
+    candles.add("EURUSD", quote(10.0, 1.0))
+    candles.add("EURUSD", quote(11.0, 2.0))
+    candles.add("EURUSD", quote(10.5, 9.0))
+    assert candles.history("EURUSD", 1)["high"].tolist() == [1.0]
+    assert candles.current("EURUSD", 1)["high"] == 2.0
+
+
+def test_conflated_high_low():
+    candles = CandleAggregator((60,))
+    candles.add("EURUSD", {"time": 0.0, "value": 1.0, "high": 1.5, "low": 0.9, "ticks": 4})
+    current = candles.current("EURUSD", 60)
+    assert (current["high"], current["low"], current["ticks"]) == (1.5, 0.9, 4)
+
+
+def test_history_capacity_and_open_candle():
+    candles = CandleAggregator((1,), capacity=3)
+    for time in range(6):
+        candles.add("EURUSD", quote(float(time), float(time)))
+    history = candles.history("EURUSD", 1)
+    assert history["time"].tolist() == [2.0, 3.0, 4.0]
+    history = candles.history("EURUSD", 1, include_open=True)
+    assert history["time"].tolist() == [2.0, 3.0, 4.0, 5.0]
+    assert history["close"].tolist() == [2.0, 3.0, 4.0, 5.0]
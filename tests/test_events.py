@@ -0,0 +1,49 @@
+from iqoption_api import fastjson
+from iqoption_api.api import IQOption
+from iqoption_api.events import EventQueue
+
+
+def quote_frame(symbol, time):
+    return fastjson.dumps({"name": "newChartData", "msg": {
+        "active_id": 1, "symbol": symbol, "bid": 1.1, "ask": 1.2, "value": 1.15, "volume": 0, "time": time}})
+
+
+def position_frame(position_id, status):
+    return fastjson.dumps({"name": "position-changed", "msg": {
+        "id": position_id, "status": status, "instrument_type": "forex", "instrument_id": "EURUSD", "leverage": 50,
+        "buy_avg_price_enrolled": 1.1, "sell_avg_price_enrolled": 0.0, "create_at": 1500000000000,
+        "close_at": 1500000001000, "close_reason": "default", "orders": []}})
+
+
+def test_frames_keep_their_order_with_many_workers():
+    handled = []
+    events = EventQueue(lambda frame: handled.append(fastjson.loads(frame)), workers=4, overflow=EventQueue.BLOCK)
+    symbols = ["SYM{}".format(k) for k in range(8)]
+    for k in range(4000):
+        events.put(quote_frame(symbols[k % len(symbols)], k), "newChartData")
+        if k % 10 == 0:
+            events.put(position_frame(k, "open"), "position-changed")
+            events.put(position_frame(k, "closed"), "position-changed")
+    events.stop()
+    assert events.processed == len(handled) == 4000 + 800
+    for symbol in symbols:
+        times = [m["msg"]["time"] for m in handled if m["msg"].get("symbol") == symbol]
+        assert times == sorted(times) and len(times) == 500
+    positions = [(m["msg"]["id"], m["msg"]["status"]) for m in handled if m["name"] == "position-changed"]
+    assert positions == [(k, status) for k in range(0, 4000, 10) for status in ("open", "closed")]
+
+
+def test_api_with_many_workers():
+    api = IQOption("mail@email.com", "password", workers=4, overflow="block")
+    api.send_raw = lambda payload: None
+    symbols = ["SYM{}".format(k) for k in range(4)]
+    for k in range(8000):
+        api.on_socket_message(None, quote_frame(symbols[k % len(symbols)], 1500000000.0 + k))
+        if k % 20 == 0:
+            api.on_socket_message(None, position_frame(k, "open"))
+            api.on_socket_message(None, position_frame(k, "closed"))
+    api.events.stop()
+    for symbol in symbols:
+        times = api.market_data[symbol].times()
+        assert (times[1:] > times[:-1]).all() and len(times) == 2000
+    assert api.get_open_positions() == []
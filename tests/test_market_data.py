@@ -0,0 +1,25 @@
+from iqoption_api.market_data import TickStore
+
+
+def quote(time, value):
+    return {"time": time, "bid": value - 0.1, "ask": value + 0.1, "value": value}
+
+
+def test_mapping_over_distinct_times():
+    store = TickStore(100)
+    for time, value in ((1, 1.0), (1, 1.1), (2, 1.2), (3, 1.3), (3, 1.4)):
+        store.append(quote(time, value))
+    assert len(store) == len(list(store)) == 3
+    assert store.tick_count() == 5
+    assert store[3]["value"] == 1.4
+    assert dict(store) == {1: store[1], 2: store[2], 3: store[3]}
+
+
+def test_capacity_and_window():
+    store = TickStore(3, window=10)
+    for time in range(5):
+        store.append(quote(time, 1.0))
+    assert list(store) == [2, 3, 4] and store.tick_count() == 3
+    store.append(quote(20, 1.0))
+    assert list(store) == [20] and len(store) == 1
+    assert len(TickStore(3)) == 0
@@ -0,0 +1,93 @@
+import time
+from concurrent.futures import Future
+
+from iqoption_api import fastjson
+from iqoption_api.api import IQOption
+from iqoption_api.orders import OrderTracker, OrderError
+
+
+def order(order_id, status, order_type="market"):
+    return {"id": order_id, "status": status, "type": order_type}
+
+
+def test_order_changed_before_placed_reply():
+    tracker = OrderTracker(timeout=1)
+    request = Future()
+    future = tracker.track_open(request, "market")
+    tracker.on_order_changed(order(1, "new"))
+    tracker.on_order_changed(order(1, "filled"))
+    request.set_result({"id": 1})
+    assert future.result(0)["status"] == "filled"
+
+
+def test_accepted_limit_before_placed_reply():
+    tracker = OrderTracker(timeout=1)
+    request = Future()
+    future = tracker.track_open(request, "limit")
+    tracker.on_order_changed(order(2, "new", "limit"))
+    request.set_result({"id": 2})
+    assert future.result(0)["status"] == "new"
+
+
+def test_placed_before_order_changed():
+    tracker = OrderTracker(timeout=1)
+    request = Future()
+    future = tracker.track_open(request, "market")
+    request.set_result({"id": 3})
+    tracker.on_order_changed(order(3, "new"))
+    assert not future.done()
+    tracker.on_order_changed(order(3, "rejected"))
+    assert isinstance(future.exception(0), OrderError)
+
+
+def test_cancel():
+    tracker = OrderTracker(timeout=1)
+    future = tracker.expect_cancel(4)
+    tracker.on_order_changed(order(4, "canceled", "limit"))
+    assert future.result(0)["status"] == "canceled"
+    assert 4 not in tracker._recent
+
+
+def api_with_position():
+    api = IQOption("mail@email.com", "password", request_timeout=0.05, order_timeout=5)
+    api.sent = []
+    api.send_raw = lambda payload: api.sent.append(fastjson.loads(payload))
+    api.process_message(fastjson.dumps({"name": "position-changed", "msg": POSITION}))
+    return api
+
+
+POSITION = {"id": 1, "status": "open", "instrument_type": "forex", "instrument_id": "EURUSD", "leverage": 50,
+            "buy_avg_price_enrolled": 1.1, "sell_avg_price_enrolled": 0.0, "create_at": 1500000000000,
+            "close_at": 1500000001000, "close_reason": "default", "orders": []}
+
+
+def acknowledge(api):
+    request_id = api.sent[-1]["request_id"]
+    api.process_message(fastjson.dumps({"name": "result", "request_id": request_id, "msg": {"success": True}, "status": 0}))
+    assert request_id not in api.pending
+
+
+def test_close_position_outlives_request_timeout():
+    api = api_with_position()
+    future = api.close_position(1)
+    acknowledge(api)
+    time.sleep(0.1)
+    api.process_message(fastjson.dumps({"name": "position-changed", "msg": dict(POSITION, status="closed")}))
+    assert not future.result(0).is_open()
+
+
+def test_cancel_order_outlives_request_timeout():
+    api = api_with_position()
+    future = api.cancel_order(9)
+    acknowledge(api)
+    time.sleep(0.1)
+    api.process_message(fastjson.dumps({"name": "order-changed", "msg": dict(order(9, "canceled", "limit"), position_id=1)}))
+    assert future.result(0)["status"] == "canceled"
+
+
+def test_placed_reply_without_id():
+    tracker = OrderTracker(timeout=1)
+    request = Future()
+    future = tracker.track_open(request, "market")
+    request.set_result({"message": "unexpected"})
+    assert isinstance(future.exception(0), OrderError)
@@ -0,0 +1,70 @@
+from iqoption_api import fastjson
+from iqoption_api.api import IQOption
+from iqoption_api.pending import PendingRequests, RequestError, RequestTimeout
+
+
+def test_resolve_and_latency():
+    pending = PendingRequests(timeout=10)
+    request_id = pending.new_id()
+    future = pending.register(request_id, "get-positions")
+    assert request_id in pending and len(pending) == 1
+    pending.resolve(request_id, {"positions": []})
+    assert future.result(0) == {"positions": []}
+    assert future.latency is not None and request_id not in pending
+    assert pending.resolve(request_id, {}) is None
+
+
+def test_expire():
+    pending = PendingRequests(timeout=10)
+    early = pending.register("a", "x", timeout=1)
+    late = pending.register("b", "y")
+    sent_at = early.sent_at
+    pending.expire(sent_at + 0.5)
+    assert not early.done()
+    pending.expire(sent_at + 2)
+    assert isinstance(early.exception(0), RequestTimeout)
+    assert not late.done() and "b" in pending
+    pending.expire(sent_at + 11)
+    assert isinstance(late.exception(0), RequestTimeout) and len(pending) == 0
+
+
+def test_cancel_all():
+    pending = PendingRequests()
+    futures = [pending.register(pending.new_id(), "x") for _ in range(3)]
+    pending.cancel_all(RequestError("connection lost"))
+    assert all(isinstance(future.exception(0), RequestError) for future in futures)
+
+
+def offline_api():
+    api = IQOption("mail@email.com", "password")
+    api.sent = []
+    api.send_raw = lambda payload: api.sent.append(fastjson.loads(payload))
+    return api
+
+
+def reply(api, name, msg, status=0):
+    api.process_message(fastjson.dumps({"name": name, "request_id": api.sent[-1]["request_id"], "msg": msg, "status": status}))
+
+
+def test_error_status_fails_request():
+    api = offline_api()
+    future = api.send_socket_message("sendMessage", {"name": "get-positions", "version": "1.0", "body": {}})
+    reply(api, "positions", {"message": "denied"}, status=4001)
+    assert isinstance(future.exception(0), RequestError)
+
+
+def test_result_only_resolves_ack_requests():
+    api = offline_api()
+    future = api.send_socket_message("sendMessage", {"name": "get-positions", "version": "1.0", "body": {}})
+    reply(api, "result", {"success": True})
+    assert not future.done()
+    reply(api, "positions", {"positions": [], "total": 0})
+    assert future.result(0)["total"] == 0
+
+    acked = api.send_socket_message("sendMessage", {"name": "change-tpsl", "version": "1.0", "body": {}}, ack=True)
+    reply(api, "result", {"success": True})
+    assert acked.result(0) == {"success": True}
+
+    rejected = api.send_socket_message("sendMessage", {"name": "change-tpsl", "version": "1.0", "body": {}}, ack=True)
+    reply(api, "result", {"success": False})
+    assert isinstance(rejected.exception(0), RequestError)
@@ -0,0 +1,59 @@
+import math
+import random
+
+from iqoption_api.portfolio import evaluate_positions
+from iqoption_api.position import Position, round_sig
+
+
+def random_position(rng, index):
+    price = rng.uniform(0.5, 2000)
+    sell = rng.random() < 0.5
+    data = {"id": index, "status": "open", "instrument_id": "X", "leverage": rng.choice([1, 3, 50, 100, 500]),
+            "buy_avg_price_enrolled": 0.0 if sell else price, "sell_avg_price_enrolled": price if sell else 0.0}
+    position = Position(data)
+    if rng.random() < 0.5:
+        position.update_order({"id": index, "type": "stop", "status": "new", "stop_price": price * rng.uniform(0.9, 1.1)})
+    return position
+
+
+def same(a, b):
+    return a == b or (math.isnan(a) and math.isnan(b))
+
+
+def test_matches_scalar_methods():
+    rng = random.Random(7)
+    positions = [random_position(rng, i) for i in range(2000)]
+    quotes = [{"bid": pos.get_open_price() * rng.uniform(0.95, 1.05), "ask": pos.get_open_price() * rng.uniform(0.95, 1.05)} for pos in positions]
+    result = evaluate_positions(positions, [q["bid"] for q in quotes], [q["ask"] for q in quotes], percent_buffer=0.3)
+    for i, (pos, quote) in enumerate(zip(positions, quotes)):
+        assert result["id"][i] == pos.id
+        assert same(result["current_win"][i], pos.get_current_win(quote))
+        assert same(result["stop_loss_percent"][i], pos.stop_loss_percent())
+        assert same(result["stoploss"][i], pos.get_stoploss(0.3, quote))
+        assert same(result["takeprofit"][i], pos.get_takeprofit(0.3, quote))
+
+
+def test_missing_quote_is_nan():
+    rng = random.Random(1)
+    positions = [random_position(rng, i) for i in range(4)]
+    nan = float("nan")
+    result = evaluate_positions(positions, [nan] * 4, [nan] * 4, percent_buffer=0.3)
+    for key in ("current_win", "stoploss", "takeprofit"):
+        assert all(math.isnan(x) for x in result[key])
+
+
+def test_zero_leverage_is_nan():
+    positions = []
+    for buy, sell in ((1.1, 0.0), (0.0, 1.1)):
+        position = Position({"id": 1, "status": "open", "leverage": 0, "buy_avg_price_enrolled": buy, "sell_avg_price_enrolled": sell})
+        position.update_order({"id": 2, "type": "stop", "status": "new", "stop_price": 1.0})
+        positions.append(position)
+    result = evaluate_positions(positions, [1.2, 1.2], [1.3, 1.3], percent_buffer=0.3)
+    for key in ("stoploss", "takeprofit"):
+        assert all(math.isnan(x) for x in result[key])
+
+
+def test_round_sig_non_finite():
+    assert math.isnan(round_sig(float("nan")))
+    assert math.isnan(round_sig(float("inf")))
+    assert round_sig(0.0) == 0
@@ -0,0 +1,33 @@
+import copy
+import pickle
+
+from iqoption_api.position import Position
+
+
+def make_position():
+    position = Position({"id": 1, "status": "open", "instrument_id": "EURUSD", "leverage": 100,
+                         "buy_avg_price_enrolled": 1.1, "sell_avg_price_enrolled": 0.0,
+                         "orders": [{"id": 7, "type": "stop", "status": "new", "stop_price": 1.09}],
+                         "user_id": 42})
+    position.update_watermarks(0.5)
+    return position
+
+
+def test_copy_and_pickle_round_trip():
+    position = make_position()
+    for clone in (copy.copy(position), copy.deepcopy(position), pickle.loads(pickle.dumps(position))):
+        assert clone.get_data() == position.get_data()
+        assert clone.user_id == 42
+        assert clone.get_order(7)["stop_price"] == 1.09
+        assert clone.max_watermark == 0.5
+
+
+def test_unknown_attribute():
+    position = make_position()
+    for name in ("missing", "_missing"):
+        try:
+            getattr(position, name)
+        except AttributeError:
+            pass
+        else:
+            raise AssertionError(name)
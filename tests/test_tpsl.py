@@ -0,0 +1,46 @@
+import logging
+import threading
+import time
+
+from iqoption_api.api import IQOption
+from iqoption_api.periodic import Periodic
+from iqoption_api.tpsl import TPSLScheduler
+
+
+def test_closed_position_is_forgotten():
+    api = IQOption("mail@email.com", "password")
+    api.tpsl = TPSLScheduler(lambda position_id, stop_lose, take_profit: None)
+    data = {"id": 5, "status": "open", "instrument_id": "EURUSD", "leverage": 100,
+            "buy_avg_price_enrolled": 1.1, "sell_avg_price_enrolled": 0.0}
+    api.parse_position_message(data)
+    api.tpsl.set(5, 1.05, 1.2)
+    api.tpsl.confirm(5)
+    assert 5 in api.tpsl._confirmed
+    api.parse_position_message(dict(data, status="closed", close_reason="default", close_at=1512136902059, create_at=1512136901477))
+    assert all(5 not in state for state in (api.tpsl._confirmed, api.tpsl._last_sent, api.tpsl._retries))
+
+
+def test_periodic_survives_errors():
+    calls = []
+    called = threading.Event()
+
+    def function():
+        calls.append(time.time())
+        if len(calls) == 3:
+            called.set()
+        raise RuntimeError("boom")
+
+    periodic = Periodic(function, 0.001, "test-periodic", logging.getLogger("test"))
+    periodic.start()
+    assert called.wait(2)
+    periodic.stop()
+    count = len(calls)
+    time.sleep(0.01)
+    assert len(calls) == count
+
+
+def test_budget_options():
+    api = IQOption("mail@email.com", "password", tpsl_rate=2, tpsl_burst=4, tpsl_position_interval=1.5,
+                   tpsl_confirm_timeout=7, tpsl_max_retries=1)
+    tpsl = api.tpsl
+    assert (tpsl.rate, tpsl.burst, tpsl.position_interval, tpsl.confirm_timeout, tpsl.max_retries) == (2, 4, 1.5, 7, 1)
@@ -0,0 +1,30 @@
+import json
+import logging
+
+from iqoption_api.tracing import SampledTracer
+
+
+class Collect(logging.Handler):
+    def __init__(self):
+        logging.Handler.__init__(self)
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(json.loads(record.getMessage()))
+
+
+def test_tracers_are_independent():
+    shared = logging.getLogger(SampledTracer.logger_name)
+    state = (shared.level, shared.propagate, list(shared.handlers))
+    a, b = Collect(), Collect()
+    tracer_a, tracer_b = SampledTracer(2, a), SampledTracer(2, b)
+    tracer_a.start()
+    tracer_b.start()
+    for time in range(4):
+        tracer_a.quote("EURUSD", {"time": time, "bid": 1.1, "ask": 1.2})
+    tracer_b.event("position", id=7)
+    tracer_a.stop()
+    tracer_b.stop()
+    assert [line["time"] for line in a.lines] == [1, 3] and [line["count"] for line in a.lines] == [2, 4]
+    assert [line["event"] for line in b.lines] == ["position"]
+    assert (shared.level, shared.propagate, list(shared.handlers)) == state
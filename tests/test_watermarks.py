@@ -0,0 +1,61 @@
+import os
+
+from iqoption_api.watermarks import RECORD, WatermarkStore
+
+
+class Marks(object):
+    def __init__(self, id, low, high, current):
+        self.id = id
+        self.min_watermark = low
+        self.max_watermark = high
+        self.current_watermark = current
+
+
+def test_round_trip_and_tombstone(tmp_path):
+    path = str(tmp_path / "watermarks.log")
+    store = WatermarkStore(path)
+    store.record(Marks(1, -5.0, 10.0, 2.0))
+    store.record(Marks(2, -1.0, 1.0, 0.0))
+    store.flush()
+    store.forget(2)
+    store.record(Marks(1, -6.0, 10.0, -6.0))
+    store.flush()
+    assert os.path.getsize(path) == 4 * RECORD.size
+    assert WatermarkStore(path).load() == {1: {"min": -6.0, "max": 10.0, "current": -6.0}}
+
+
+def test_torn_record_is_ignored_and_truncated(tmp_path):
+    path = str(tmp_path / "watermarks.log")
+    store = WatermarkStore(path)
+    store.record(Marks(1, -5.0, 10.0, 2.0))
+    store.flush()
+    with open(path, "ab") as f:
+        f.write(RECORD.pack(2, 1.0, 2.0, 3.0)[:RECORD.size // 2])
+    store = WatermarkStore(path)
+    assert store.load() == {1: {"min": -5.0, "max": 10.0, "current": 2.0}}
+    assert os.path.getsize(path) == RECORD.size
+    # appending after the recovery keeps the log readable
+    store.record(Marks(3, 0.0, 0.0, 0.0))
+    store.flush()
+    assert sorted(WatermarkStore(path).load()) == [1, 3]
+
+
+def test_compaction(tmp_path):
+    path = str(tmp_path / "watermarks.log")
+    store = WatermarkStore(path, compact_ratio=2)
+    for value in range(40):
+        store.record(Marks(1, -value, value, value))
+        store.flush()
+    assert os.path.getsize(path) < 40 * RECORD.size
+    assert not os.path.exists(path + ".tmp")
+    assert WatermarkStore(path).load() == {1: {"min": -39.0, "max": 39.0, "current": 39.0}}
+
+
+def test_close_writes_pending(tmp_path):
+    path = str(tmp_path / "watermarks.log")
+    store = WatermarkStore(path, flush_interval=60)
+    store.load()
+    store.start()
+    store.record(Marks(1, 1.0, 2.0, 3.0))
+    store.close()
+    assert WatermarkStore(path).load() == {1: {"min": 1.0, "max": 2.0, "current": 3.0}}